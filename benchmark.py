@@ -0,0 +1,179 @@
+import refinitiv_rest
+import mock_server
+import download
+
+from refinitiv_rest import Session,Futures,Trades,Quotes,Depths,IntraDay,EndOfDay
+from download import Downloader,parallel_download,contiguous_chunks
+from multiprocessing import Process,Queue
+from time import time
+import resource
+import tempfile
+import shutil
+import json
+import os
+
+## SETTINGS ###################################################################
+
+# every case runs against the mock server in a scratch directory of its own
+BENCH_DIR = "benchmark"
+BENCHMARK_FILE = "benchmark.json"
+
+START_DATE = "2024-01-02"
+END_DATE = "2024-01-31"
+
+REPORT_TYPES = ["Trades"]
+WORKER_COUNTS = [1,4,8]
+CHUNK_SIZES = [1,2,5]
+
+# how slow and how large the mock jobs are
+MOCK_OPTIONS = {
+    "delay": mock_server.EXTRACTION_DELAY,
+    "rows_per_day": mock_server.ROWS_PER_DAY,
+    "throttle_rate": mock_server.THROTTLE_RATE
+}
+
+REPORTS = {
+    "Trades": Trades,
+    "Quotes": Quotes,
+    "Depths": Depths,
+    "IntraDay": IntraDay,
+    "EndOfDay": EndOfDay
+}
+
+## CASES ######################################################################
+
+def make_extraction(report_type):
+    session = Session("benchmark","benchmark")
+    return REPORTS[report_type](session,Futures("ES","US/Central"))
+
+def downloader_case(report_type,num_dates,num_procs):
+    # one blocking job per chunk, one after the other
+    extraction = make_extraction(report_type)
+    dates = extraction.request_dates(START_DATE,END_DATE)
+    positions = {date: i for i,date in enumerate(dates)}
+
+    for start_date,end_date in contiguous_chunks(dates,num_dates,positions):
+        Downloader(extraction,start_date,end_date)
+
+def parallel_case(report_type,num_dates,num_procs):
+    extraction = make_extraction(report_type)
+    parallel_download(
+        extraction,
+        START_DATE,
+        END_DATE,
+        num_procs = num_procs,
+        num_dates = num_dates,
+        resume = False
+    )
+
+CASES = {
+    "Downloader": downloader_case,
+    "parallel_download": parallel_case
+}
+
+## MEASUREMENT ################################################################
+
+def configure(workdir,port):
+    # relative data paths land in the scratch directory, and the token cache
+    # and rate limiter stay apart from the ones used against the real api
+    os.chdir(workdir)
+    refinitiv_rest.BASE_URL = mock_server.mock_url(port)
+    refinitiv_rest.TOKEN_CACHE = os.path.join(workdir,"tokens.json")
+    refinitiv_rest.RATE_LIMIT_FILE = os.path.join(workdir,"ratelimit.json")
+
+def totals(name):
+    # add up a metric over every security, report and chunk size
+    count,total = 0,0.0
+    for item in download.metrics.REGISTRY.to_list():
+        if item["name"] == name:
+            count += item["count"]
+            total += item["sum"]
+    return count,total
+
+def measure(suite,report_type,num_dates,num_procs,port,results):
+    workdir = tempfile.mkdtemp(prefix="case-",dir=os.path.abspath(BENCH_DIR))
+    configure(workdir,port)
+
+    timer = time()
+    CASES[suite](report_type,num_dates,num_procs)
+    elapsed_time = time() - timer
+
+    # worker processes have all been joined, so their usage is counted too
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu_time = own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+    jobs,total_bytes = totals("download_bytes")
+    results.put({
+        "suite": suite,
+        "report_type": report_type,
+        "workers": num_procs,
+        "chunk_days": num_dates,
+        "jobs": jobs,
+        "seconds": elapsed_time,
+        "jobs_per_min": 60 * jobs / elapsed_time,
+        "mb_per_sec": total_bytes / 1e6 / elapsed_time,
+        "peak_rss_mb": max(own.ru_maxrss,children.ru_maxrss) / 1024,
+        "cpu_seconds": cpu_time,
+        "cpu_percent": 100 * cpu_time / elapsed_time
+    })
+
+    shutil.rmtree(workdir)
+
+def run_case(suite,report_type,num_dates,num_procs=1,port=mock_server.MOCK_PORT):
+    # a fresh process per case, so peak memory and cpu time start from zero
+    results = Queue()
+    case = Process(
+        target = measure,
+        args = (suite,report_type,num_dates,num_procs,port,results),
+        name = "Benchmark"
+    )
+
+    case.start()
+    case.join()
+
+    # a case that crashed has nothing to report
+    if case.exitcode != 0:
+        raise RuntimeError("%s case failed with exit code %s" % (suite,case.exitcode))
+
+    return results.get()
+
+def run_benchmarks(report_types=REPORT_TYPES,worker_counts=WORKER_COUNTS,
+        chunk_sizes=CHUNK_SIZES,port=mock_server.MOCK_PORT,**options):
+    os.makedirs(BENCH_DIR,exist_ok=True)
+    server = mock_server.start_server(port,**{**MOCK_OPTIONS,**options})
+
+    results = []
+    try:
+        for report_type in report_types:
+            for num_dates in chunk_sizes:
+                results.append(run_case("Downloader",report_type,num_dates,1,port))
+                for num_procs in worker_counts:
+                    results.append(run_case("parallel_download",report_type,num_dates,num_procs,port))
+    finally:
+        mock_server.stop_server(server)
+
+    with open(os.path.join(BENCH_DIR,BENCHMARK_FILE),"w") as f:
+        json.dump(results,f,indent=4)
+
+    return results
+
+def print_results(results):
+    columns = "%-18s %-9s %7s %5s %8s %8s %9s %6s"
+    print(columns % ("suite","report","workers","days","jobs/min","MB/s","RSS MB","CPU %"))
+    for result in results:
+        print(columns % (
+            result["suite"],
+            result["report_type"],
+            result["workers"],
+            result["chunk_days"],
+            "%.1f" % (result["jobs_per_min"]),
+            "%.2f" % (result["mb_per_sec"]),
+            "%.1f" % (result["peak_rss_mb"]),
+            "%.0f" % (result["cpu_percent"])
+        ))
+
+## MAIN #######################################################################
+
+if __name__ == "__main__":
+    print_results(run_benchmarks())
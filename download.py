@@ -1,14 +1,41 @@
 from refinitiv_rest import *
-from time import sleep
 
-from multiprocessing import Process,Queue
-from tracker import Tracker
-import queue
+from multiprocessing import Process
+from concurrent.futures import ThreadPoolExecutor
+from tracker import Tracker,start_renderer,stop_renderer
+import asyncio
+import contextlib
+import threading
+import sqlite3
+import metrics
+import tempfile
+import shutil
+
+from time import time,sleep
 
 import pandas as pd
 
 ## SERIAL DOWNLOADER ##########################################################
 
+def is_next(date,previous,positions=None):
+    # consecutive in the request calendar, or in calendar days without one
+    if positions is not None:
+        return positions[date] - positions[previous] == 1
+    return pd.Timestamp(date) - pd.Timestamp(previous) == pd.Timedelta(days=1)
+
+def contiguous_chunks(dates,n,positions=None):
+    # chunks never span a requested date that is left out, e.g. one already
+    # downloaded, but may span days on which nothing trades
+    run = []
+    for date in dates:
+        if run and not is_next(date,run[-1],positions):
+            yield from chunks(run,n)
+            run = []
+        run.append(date)
+
+    if run:
+        yield from chunks(run,n)
+
 def chunks(array,n):
     m = len(array)
     for i in range(0,m,n):
@@ -21,7 +48,7 @@ def chunks(array,n):
 
 class Downloader:
     out_of_space = False
-    def __init__(self,extraction,start_date,end_date=None,line_num=1):
+    def __init__(self,extraction,start_date,end_date=None,line_num=1,max_attempts=3,events=None):
         self.start_date = start_date
         self.end_date = end_date
         self.task = extraction
@@ -29,90 +56,604 @@ class Downloader:
         self.session  = extraction.session
         self.base_ric = extraction.security.base_ric
 
-        interval_end  = start_date if end_date is None else end_date
-        date_interval = "%s-%s" % (self.start_date,interval_end)
-        self.filename = "%s.csv.gz" % (date_interval)
+        self.job = Job(extraction,start_date,end_date)
+        self.filename = self.job.filename
 
         report_type  = "(%s)" % self.task.report_type
-        task_info    = "%s %s %s" % (self.base_ric,report_type,date_interval)
-        self.tracker = Tracker(line_num,task_info)
+        task_info    = "%s %s %s" % (self.base_ric,report_type,self.job.date_interval)
+        self.tracker = Tracker(line_num,task_info,events)
+
+        # a single job on the async engine, blocking until it is done
+        engine = Engine(self.session,max_jobs=1,max_attempts=max_attempts,on_update=self.track)
+        engine.run([self.job])
+        self.out_of_space = self.job.out_of_space
+        self.finished = self.job.finished
+
+    def track(self,job,message,done):
+        if done:
+            self.tracker.end_tracking(message)
+        else:
+            self.tracker.begin_tracking(message)
+
+## ASYNC ENGINE ###############################################################
+
+class Job:
+    def __init__(self,extraction,start_date,end_date=None):
+        self.task = extraction.clone()
+        self.start_date = start_date
+        self.end_date = start_date if end_date is None else end_date
+
+        self.date_interval = "%s-%s" % (self.start_date,self.end_date)
+        self.filename = "%s.csv.gz" % (self.date_interval)
+
+        self.job_id = None
+        self.rows = None
+        self.seconds = None
+        self.attempts = 0
+        self.error = None
+        self.finished = False
+        self.out_of_space = False
+
+class Engine:
+    def __init__(self,session,max_jobs=200,max_threads=32,timeout=600,
+            max_attempts=3,retry_delay=10,on_update=None):
+        self.session = session
+        self.max_jobs = max_jobs
+        self.max_threads = min(max_threads,max_jobs)
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.on_update = on_update
+
+        # the connection pool should be able to serve every thread at once
+        if session.pool_size < self.max_threads:
+            session.pool_size = self.max_threads
+            session.open_transport()
 
-        # make request
-        self.make_request()
-        self.download_request()
+    def notify(self,job,message,done=False):
+        if self.on_update is not None:
+            self.on_update(job,message,done)
 
-    def make_request(self):
-        self.request = self.task.request(self.start_date,self.end_date)
-        self.tracker.begin_tracking("Requesting")
+    async def call(self,func,*args):
+        # every blocking HTTP call or file operation runs on the thread pool
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor,func,*args)
 
-        # progress check
-        self.check_request()
+    def tags(self,job):
+        # stage timings are broken down by security, report and chunk size
+        return {
+            "base_ric": job.task.security.base_ric,
+            "report_type": job.task.report_type,
+            "chunk_days": len(job.task.request_dates(job.start_date,job.end_date))
+        }
 
-    def make_request(self):
+    async def submit(self,job):
+        with metrics.timer("submit_seconds",**self.tags(job)):
+            job.job_id = await self.call(job.task.request,job.start_date,job.end_date)
+
+    async def poll(self,job):
+        # the session's poller watches this job alongside every other one
+        poller = self.session.get_poller()
+        future = poller.track(job.job_id,job.task.report_type)
+
+        timer = time()
         try:
-            self.tracker.begin_tracking("Requesting")
-            self.request = self.task.request(self.start_date,self.end_date)
-        except Exception:
-            # sometimes the actual request fails because of too many API calls
-            self.task = self.unmodified_extraction
-            sleep(10)
-            self.make_request()
-
-        json_response = self.session.check_status(self.request,timeout=60)        
-        if json_response.status_code == 200:
-            self.tracker.end_tracking("Requested")
-            sleep(2)
-        else:
-            self.tracker.end_tracking("Request Failed")
+            json_response = await asyncio.wait_for(asyncio.wrap_future(future),self.timeout)
+        except asyncio.TimeoutError:
+            poller.untrack(job.job_id)
+            raise TimeoutError("Exceeded maximum status checks for %s" % (job.job_id))
+
+        if json_response.status_code != 200:
+            raise requests.RequestException(
+                "Extraction %s failed with status %d" % (job.job_id,json_response.status_code)
+            )
+
+        # whatever the server did not spend extracting was spent in its queue
+        waited = time() - timer
+        extracting = extraction_seconds(json_response)
+        if extracting is not None:
+            metrics.observe("extraction_seconds",extracting,**self.tags(job))
+            waited = max(waited - extracting,0)
+        metrics.observe("queue_wait_seconds",waited,**self.tags(job))
+
+        return json_response
+
+    async def fetch(self,job):
+        # download completed request and split into daily files
+        tags = self.tags(job)
+        stats = await self.call(job.task.download_report,job.filename)
+        metrics.observe("download_seconds",stats["seconds"],**tags)
+        metrics.observe("download_bytes",stats["bytes"],**tags)
+        metrics.observe("download_bytes_per_sec",stats["bytes_per_sec"],**tags)
+
+        with metrics.timer("split_seconds",**tags):
+            row_counts = await self.call(job.task.split_files,job.filename)
+
+        job.rows = count_rows(row_counts)
+        metrics.observe("split_rows",job.rows,**tags)
+
+    async def run_job(self,job):
+        async with self.slots:
+            while (not job.finished) and (job.attempts < self.max_attempts):
+                job.attempts += 1
+                timer = time()
+
+                try:
+                    self.notify(job,"Requesting")
+                    await self.submit(job)
+                    await self.poll(job)
+                except Exception as e:
+                    # sometimes the actual request fails because of too many API calls
+                    job.error = e
+                    self.notify(job,"Request Failed",True)
+                    if job.attempts < self.max_attempts:
+                        await asyncio.sleep(self.retry_delay * 2**(job.attempts-1))
+                    continue
+                else:
+                    self.notify(job,"Requested",True)
+
+                try:
+                    self.notify(job,"Downloading")
+                    await self.fetch(job)
+                except OSError as e:
+                    job.error = e
+                    if e.errno == 28:
+                        job.out_of_space = True
+                        self.notify(job,"Insufficient Disk Space",True)
+                        break
+                    self.notify(job,"Download Failed",True)
+                except Exception as e:
+                    job.error = e
+                    self.notify(job,"Download Failed",True)
+                else:
+                    job.finished = True
+                    job.seconds = time() - timer
+                    record_history(job)
+
+                    rate = job.task.download_stats["bytes_per_sec"] / 1e6
+                    self.notify(job,"Downloaded %.1fMB/s" % (rate),True)
+
+        return job
+
+    async def gather(self,jobs):
+        self.slots = asyncio.Semaphore(self.max_jobs)
+        with ThreadPoolExecutor(self.max_threads) as self.executor:
+            return await asyncio.gather(*[self.run_job(job) for job in jobs])
+
+    async def drain(self,extraction,scheduler,planner,jobs):
+        while True:
+            # retries that are due come first, then a fresh chunk, which a slot
+            # only asks for once it is free so that the chunk reflects every
+            # job that finished before it
+            task,wait = scheduler.claim(extraction)
+            if task is None:
+                date_chunk = None if planner is None else planner.next_chunk()
+                if date_chunk is not None:
+                    # another worker is on these dates already
+                    task = scheduler.add(extraction,*date_chunk,claim=True)
+                    if task is None:
+                        continue
+                elif wait is not None:
+                    await asyncio.sleep(min(wait,self.timeout))
+                    continue
+                else:
+                    return
+
+            task_id,start_date,end_date = task
+            job = Job(extraction,start_date,end_date)
+            jobs.append(job)
+
+            await self.run_job(job)
+            if job.finished:
+                scheduler.complete(task_id)
+                if planner is not None:
+                    planner.record(job)
+            else:
+                scheduler.fail(task_id,job.error)
+
+    async def gather_scheduled(self,extraction,scheduler,planner):
+        jobs = []
+        self.slots = asyncio.Semaphore(self.max_jobs)
+        with ThreadPoolExecutor(self.max_threads) as self.executor:
+            drains = [self.drain(extraction,scheduler,planner,jobs) for _ in range(self.max_jobs)]
+            await asyncio.gather(*drains)
+
+        return jobs
+
+    def run(self,jobs):
+        return self.launch(self.gather(jobs))
+
+    def run_scheduled(self,extraction,scheduler,planner=None):
+        return self.launch(self.gather_scheduled(extraction,scheduler,planner))
+
+    def launch(self,coroutine):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coroutine)
+
+        # already inside an event loop (e.g. a notebook), so use a fresh one
+        with ThreadPoolExecutor(1) as pool:
+            return pool.submit(asyncio.run,coroutine).result()
+
+## PLANNER ####################################################################
+
+# chunks aim for this much data and time per job, within these bounds
+TARGET_BYTES = 512 * 2**20
+TARGET_SECONDS = 900
+MAX_DATES = 31
+HISTORY_FILE = "history.jsonl"
+
+# stage timings of the last run, summarised per security, report and chunk size
+METRICS_FILE = "metrics.json"
+
+def count_rows(row_counts):
+    # split results are keyed by date, or by security and then date
+    rows = 0
+    for count in row_counts.values():
+        if isinstance(count,dict):
+            rows += count_rows(count)
+        elif count is not None:
+            rows += count
+    return rows
+
+def record_history(job):
+    record = {
+        "base_ric": job.task.security.base_ric,
+        "report_type": job.task.report_type,
+        "days": len(job.task.request_dates(job.start_date,job.end_date)),
+        "bytes": job.task.download_stats["bytes"],
+        "rows": job.rows,
+        "seconds": job.seconds
+    }
+
+    # single appended lines are not interleaved between processes
+    history_file = data_path(HISTORY_FILE)
+    os.makedirs(os.path.dirname(history_file) or ".",exist_ok=True)
+    with open(history_file,"a") as f:
+        f.write(json.dumps(record) + "\n")
+
+class Planner:
+    def __init__(self,extraction,dates,num_dates=2,target_bytes=TARGET_BYTES,
+            target_seconds=TARGET_SECONDS,max_dates=MAX_DATES,max_history=50,positions=None):
+        self.extraction = extraction
+        self.dates = list(dates)
+        self.positions = positions
+        self.position = 0
+
+        self.num_dates = num_dates
+        self.target_bytes = target_bytes
+        self.target_seconds = target_seconds
+        self.max_dates = max_dates
+
+        # per day totals of previous jobs for the same security and report
+        self.days = 0
+        self.bytes = 0
+        self.seconds = 0
+
+        history = self.load_history()[-max_history:]
+        for record in history:
+            self.add(record["days"],record["bytes"],record["seconds"])
+
+        # before any job has run, the files already held give the size of a day
+        if not history:
+            days,_,nbytes = Catalog().summary(extraction.security.base_ric,extraction.report_type)
+            self.add(days,nbytes,0)
+
+    def load_history(self):
+        base_ric = self.extraction.security.base_ric
+        report_type = self.extraction.report_type
+
+        records = []
+        history_file = data_path(HISTORY_FILE)
+        if os.path.exists(history_file):
+            with open(history_file) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if record["base_ric"] == base_ric and record["report_type"] == report_type:
+                        records.append(record)
+
+        return records
 
-            # exception handling occurs in the API interface
-            self.task = self.unmodified_extraction
-            self.make_request()
+    def add(self,days,nbytes,seconds):
+        self.days += days
+        self.bytes += nbytes
+        self.seconds += seconds
 
-    def download_request(self):
-        # this has been acting up recently
-        self.tracker.begin_tracking("Downloading")
-        
+    def record(self,job):
+        days = len(job.task.request_dates(job.start_date,job.end_date))
+        self.add(days,job.task.download_stats["bytes"],job.seconds)
+
+    def chunk_size(self):
+        # without any history, fall back on the fixed chunk size
+        if self.days == 0:
+            return self.num_dates
+
+        by_bytes = self.target_bytes * self.days / max(self.bytes,1)
+        by_seconds = self.target_seconds * self.days / max(self.seconds,1e-6)
+        return int(min(max(min(by_bytes,by_seconds),1),self.max_dates))
+
+    def next_chunk(self):
+        if self.position >= len(self.dates):
+            return None
+
+        # grow the chunk one consecutive date at a time
+        size = self.chunk_size()
+        date_chunk = [self.dates[self.position]]
+        self.position += 1
+
+        while len(date_chunk) < size and self.position < len(self.dates):
+            next_date = self.dates[self.position]
+            if not is_next(next_date,date_chunk[-1],self.positions):
+                break
+
+            date_chunk.append(next_date)
+            self.position += 1
+
+        return [date_chunk[0],date_chunk[-1]]
+
+    def plan(self):
+        return list(iter(self.next_chunk,None))
+
+## SCHEDULER ##################################################################
+
+# failed chunks are retried with exponential backoff, then set aside
+SCHEDULER_FILE = "scheduler.sqlite"
+MAX_ATTEMPTS = 5
+RETRY_BACKOFF = 30
+MAX_BACKOFF = 3600
+
+# a run that has not beaten its heartbeat for STALE_RUN seconds is dead,
+# and the chunks it left running can be taken over
+RUN_HEARTBEAT = 30
+STALE_RUN = 300
+
+class Scheduler:
+    # tasks are (security, report type, date chunk) rows kept in sqlite, so
+    # every worker process and every later run sees the same queue; each run
+    # only claims the tasks it added itself
+    def __init__(self,path=None,max_attempts=MAX_ATTEMPTS,
+            backoff=RETRY_BACKOFF,max_backoff=MAX_BACKOFF):
+        self.path = data_path(SCHEDULER_FILE) if path is None else path
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.run = "%d-%d" % (os.getpid(),time() * 10**6)
+
+        with self.connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS tasks ("
+                "id INTEGER PRIMARY KEY, base_ric TEXT, report_type TEXT, "
+                "start_date TEXT, end_date TEXT, state TEXT, priority INTEGER, "
+                "attempts INTEGER, next_run REAL, error TEXT, run TEXT, "
+                "UNIQUE (base_ric,report_type,start_date,end_date))"
+            )
+
+            # queues written before runs were tracked
+            columns = [row[1] for row in db.execute("PRAGMA table_info(tasks)")]
+            if "run" not in columns:
+                db.execute("ALTER TABLE tasks ADD COLUMN run TEXT")
+
+            db.execute("CREATE TABLE IF NOT EXISTS runs (run TEXT PRIMARY KEY, heartbeat REAL)")
+
+        self.beat()
+
+    def beat(self):
+        with self.connect() as db:
+            db.execute(
+                "INSERT INTO runs (run,heartbeat) VALUES (?,?) "
+                "ON CONFLICT (run) DO UPDATE SET heartbeat = excluded.heartbeat",
+                (self.run,time())
+            )
+
+    @contextlib.contextmanager
+    def alive(self,interval=RUN_HEARTBEAT):
+        # beat from a thread while this process works on the run, since a
+        # single chunk can take longer than STALE_RUN to come back
+        stopped = threading.Event()
+        def beat():
+            while not stopped.wait(interval):
+                self.beat()
+
+        thread = threading.Thread(target=beat,daemon=True)
+        thread.start()
         try:
-            # download completed request and split into daily files
-            self.task.download_report(self.filename)
-            self.task.split_files(self.filename)
-            self.tracker.end_tracking("Downloaded")
-        except OSError as e:
-            if e.errno == 28:
-                self.out_of_space = True
-                self.tracker.end_tracking("Insufficient Disk Space")
+            yield self
+        finally:
+            stopped.set()
+            thread.join()
+
+    @contextlib.contextmanager
+    def connect(self):
+        os.makedirs(os.path.dirname(self.path) or ".",exist_ok=True)
+        connection = sqlite3.connect(self.path,timeout=60,isolation_level=None)
+
+        # take the write lock up front so two workers never claim one task
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            yield connection
+            connection.execute("COMMIT")
+        except:
+            connection.execute("ROLLBACK")
+            raise
+        finally:
+            connection.close()
+
+    def add(self,extraction,start_date,end_date,priority=0,claim=False):
+        # the task, or None when a worker is on that chunk right now
+        key = (extraction.security.base_ric,extraction.report_type,start_date,end_date)
+        state = "running" if claim else "pending"
+
+        with self.connect() as db:
+            # chunks of earlier runs over the same dates, e.g. with another
+            # range or chunk size, would download those dates a second time
+            db.execute(
+                "UPDATE tasks SET state = 'superseded' "
+                "WHERE base_ric = ? AND report_type = ? AND state IN ('pending','dead') "
+                "AND start_date <= ? AND end_date >= ? AND run IS NOT ? "
+                "AND NOT (start_date = ? AND end_date = ?)",
+                (*key[0:2],end_date,start_date,self.run,start_date,end_date)
+            )
+
+            # requeue a known chunk unless a worker is on it right now
+            added = db.execute(
+                "INSERT INTO tasks (base_ric,report_type,start_date,end_date,state,"
+                "priority,attempts,next_run,run) VALUES (?,?,?,?,?,?,0,?,?) "
+                "ON CONFLICT (base_ric,report_type,start_date,end_date) DO UPDATE "
+                "SET state = excluded.state, priority = excluded.priority, "
+                "attempts = 0, next_run = excluded.next_run, run = excluded.run "
+                "WHERE state != 'running'",
+                (*key,state,priority,time(),self.run)
+            ).rowcount
+
+            if not added:
+                return None
+
+            task_id = db.execute(
+                "SELECT id FROM tasks WHERE base_ric = ? AND report_type = ? "
+                "AND start_date = ? AND end_date = ?",
+                key
+            ).fetchone()[0]
+
+        return (task_id,start_date,end_date)
+
+    def claim(self,extraction):
+        # the most urgent runnable task of this run, or how long until one is
+        key = (extraction.security.base_ric,extraction.report_type,self.run)
+        with self.connect() as db:
+            row = db.execute(
+                "SELECT id,start_date,end_date FROM tasks "
+                "WHERE base_ric = ? AND report_type = ? AND run = ? "
+                "AND state = 'pending' AND next_run <= ? "
+                "ORDER BY priority DESC, next_run, start_date LIMIT 1",
+                (*key,time())
+            ).fetchone()
+
+            if row is not None:
+                db.execute("UPDATE tasks SET state = 'running' WHERE id = ?",(row[0],))
+                return row,None
+
+            next_run = db.execute(
+                "SELECT MIN(next_run) FROM tasks "
+                "WHERE base_ric = ? AND report_type = ? AND run = ? AND state = 'pending'",
+                key
+            ).fetchone()[0]
+
+        return None,(None if next_run is None else max(next_run - time(),0))
+
+    def complete(self,task_id):
+        with self.connect() as db:
+            db.execute("UPDATE tasks SET state = 'done', error = NULL WHERE id = ?",(task_id,))
+
+    def fail(self,task_id,error=None):
+        with self.connect() as db:
+            attempts = db.execute(
+                "SELECT attempts FROM tasks WHERE id = ?",(task_id,)
+            ).fetchone()[0] + 1
+
+            # give up on poisoned chunks instead of retrying them forever
+            if attempts >= self.max_attempts:
+                state,next_run = "dead",None
             else:
-                self.tracker.end_tracking("Download Failed")
-                self.download_request()
-        except Exception as e:
-            self.tracker.end_tracking("Download Failed")
-            self.download_request()
-                
+                state = "pending"
+                next_run = time() + min(self.backoff * 2**(attempts-1),self.max_backoff)
+
+            db.execute(
+                "UPDATE tasks SET state = ?, attempts = ?, next_run = ?, error = ? WHERE id = ?",
+                (state,attempts,next_run,None if error is None else repr(error),task_id)
+            )
+
+    def recover(self,extraction,stale=STALE_RUN):
+        # tasks left running by a crashed run are runnable again, while
+        # those of a run that still beats its heartbeat are left alone
+        with self.connect() as db:
+            live = time() - stale
+            db.execute(
+                "UPDATE tasks SET state = 'pending', next_run = ? "
+                "WHERE base_ric = ? AND report_type = ? AND state = 'running' "
+                "AND run IS NOT ? AND (run IS NULL OR run NOT IN "
+                "(SELECT run FROM runs WHERE heartbeat >= ?))",
+                (time(),extraction.security.base_ric,extraction.report_type,self.run,live)
+            )
+            db.execute("DELETE FROM runs WHERE heartbeat < ?",(live,))
+
+    def dead_letters(self,extraction):
+        with self.connect() as db:
+            return db.execute(
+                "SELECT start_date,end_date,attempts,error FROM tasks "
+                "WHERE base_ric = ? AND report_type = ? AND state = 'dead' ORDER BY start_date",
+                (extraction.security.base_ric,extraction.report_type)
+            ).fetchall()
 
 ## TEST CASES #################################################################
 
-def download_queue(task_list,proc_id):
+def download_queue(security,scheduler,proc_id,events=None,metrics_dir=None):
+    # connections cannot be shared across forks, so each worker opens its own
+    # pool and reuses it for every chunk it claims
+    security.session.open_transport()
+
+    # a forked worker starts with a copy of the parent's metrics
+    metrics.REGISTRY.reset()
+    try:
+        with scheduler.alive():
+            run_queue(security,scheduler,proc_id,events)
+    finally:
+        if metrics_dir is not None:
+            metrics.REGISTRY.dump(os.path.join(metrics_dir,"%d.json" % (os.getpid())))
+
+def run_queue(security,scheduler,proc_id,events=None):
     while True:
-        try:
-            task = task_list.get_nowait()
-        except queue.Empty:
-            break
+        task,wait = scheduler.claim(security)
+        if task is None:
+            if wait is None:
+                break
+
+            # only retries waiting out their backoff are left
+            sleep(wait)
+            continue
+
+        # a failed chunk goes back to the scheduler instead of blocking the worker
+        task_id,start_date,end_date = task
+        downloader = Downloader(security,start_date,end_date,proc_id,max_attempts=1,events=events)
+        if downloader.finished:
+            scheduler.complete(task_id)
         else:
-            Downloader(*task,proc_id)
+            scheduler.fail(task_id,downloader.job.error)
+
+def parallel_download(security,start_date,end_date,num_procs=8,num_dates=2,resume=True):
+    # only days on which the venue trades are requested
+    date_range = security.request_dates(start_date,end_date)
+    positions  = {date: i for i,date in enumerate(date_range)}
+
+    # skip every date with a verified file from an earlier run
+    if resume:
+        date_range = security.missing_dates(date_range)
 
-def parallel_download(security,start_date,end_date,num_procs=8,num_dates=2):
-    date_range = pd.date_range(start_date,end_date).strftime("%Y-%m-%d").to_list()
-    task_list  = Queue()
+    # without a fixed chunk size, size chunks from previous runs
+    if num_dates is None:
+        date_chunks = Planner(security,date_range,positions=positions).plan()
+    else:
+        date_chunks = contiguous_chunks(date_range,num_dates,positions)
 
-    for date_chunk in chunks(date_range,num_dates):
-        task_list.put([security,*date_chunk])
+    scheduler = Scheduler()
+    scheduler.recover(security)
+    for date_chunk in date_chunks:
+        scheduler.add(security,*date_chunk)
+
+    # every worker reports its progress to one renderer for the whole run,
+    # and leaves its stage timings behind for the parent to merge
+    events,renderer = start_renderer(processes=True)
+    os.makedirs(data_path(),exist_ok=True)
+    metrics_dir = tempfile.mkdtemp(prefix="metrics-",dir=data_path())
 
     processes = []
     for i in range(num_procs):
         proc = Process(
             target = download_queue,
-            args = (task_list,i+1),
+            args = (security,scheduler,i+1,events,metrics_dir),
             name = "Download-%d" % (i)
         )
 
@@ -122,6 +663,44 @@ def parallel_download(security,start_date,end_date,num_procs=8,num_dates=2):
     for proc in processes:
         proc.join()
 
+    stop_renderer(events,renderer)
+
+    for filename in os.listdir(metrics_dir):
+        metrics.REGISTRY.merge(os.path.join(metrics_dir,filename))
+    shutil.rmtree(metrics_dir)
+    metrics.REGISTRY.write_summary(data_path(METRICS_FILE))
+
+    # chunks which failed every attempt
+    return scheduler.dead_letters(security)
+
+def async_download(security,start_date,end_date,max_jobs=200,num_dates=None,resume=True):
+    # only days on which the venue trades are requested
+    date_range = security.request_dates(start_date,end_date)
+    positions  = {date: i for i,date in enumerate(date_range)}
+
+    # skip every date with a verified file from an earlier run
+    if resume:
+        date_range = security.missing_dates(date_range)
+
+    scheduler = Scheduler()
+    scheduler.recover(security)
+
+    # one process keeps up to max_jobs extractions in flight, and failures
+    # are retried by the scheduler rather than inside a slot
+    engine = Engine(security.session,max_jobs=max_jobs,max_attempts=1)
+    if num_dates is not None:
+        for date_chunk in contiguous_chunks(date_range,num_dates,positions):
+            scheduler.add(security,*date_chunk)
+        planner = None
+    else:
+        # chunks are sized from history and resized as jobs come back
+        planner = Planner(security,date_range,positions=positions)
+
+    with scheduler.alive():
+        jobs = engine.run_scheduled(security,scheduler,planner)
+    metrics.REGISTRY.write_summary(data_path(METRICS_FILE))
+    return jobs
+
 def serial_download(security,start_date,end_date):
     Downloader(security,start_date,end_date)
 
@@ -0,0 +1,209 @@
+from http.server import BaseHTTPRequestHandler,ThreadingHTTPServer
+from threading import Lock,Thread
+from time import time
+import contextlib
+import bisect
+import json
+import os
+
+## HISTOGRAMS #################################################################
+
+# upper bounds of the buckets, picked by the unit at the end of a metric name
+BUCKETS = {
+    "seconds": [0.01,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60,120,300,600,1800,3600],
+    "bytes_per_sec": [4**i * 1024 for i in range(11)],
+    "bytes": [4**i * 1024 for i in range(14)],
+    "rows": [10**i for i in range(10)]
+}
+
+def get_buckets(name):
+    for unit in ["bytes_per_sec","seconds","bytes","rows"]:
+        if name.endswith(unit):
+            return BUCKETS[unit]
+    return BUCKETS["seconds"]
+
+class Histogram:
+    def __init__(self,bounds):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self,value):
+        self.counts[bisect.bisect_left(self.bounds,value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min,value)
+        self.max = value if self.max is None else max(self.max,value)
+
+    def merge(self,other):
+        self.counts = [a + b for a,b in zip(self.counts,other["counts"])]
+        self.count += other["count"]
+        self.sum += other["sum"]
+        for bound,pick in [("min",min),("max",max)]:
+            if other[bound] is not None:
+                mine = getattr(self,bound)
+                setattr(self,bound,other[bound] if mine is None else pick(mine,other[bound]))
+
+    def quantile(self,q):
+        # upper bound of the bucket holding the q-th observation
+        if self.count == 0:
+            return None
+
+        rank = q * self.count
+        seen = 0
+        for bound,count in zip(self.bounds + [self.max],self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound,self.max)
+
+        return self.max
+
+    def to_dict(self):
+        return {
+            "bounds": self.bounds,
+            "counts": self.counts,
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max
+        }
+
+## REGISTRY ###################################################################
+
+class Registry:
+    # histograms keyed by metric name and tags, e.g. security and report type
+    def __init__(self):
+        self.histograms = {}
+        self.lock = Lock()
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+
+    def get(self,name,tags):
+        key = (name,tuple(sorted((k,str(v)) for k,v in tags.items())))
+        if key not in self.histograms:
+            self.histograms[key] = Histogram(get_buckets(name))
+        return self.histograms[key]
+
+    def observe(self,name,value,**tags):
+        with self.lock:
+            self.get(name,tags).observe(value)
+
+    @contextlib.contextmanager
+    def timer(self,name,**tags):
+        started = time()
+        try:
+            yield
+        finally:
+            self.observe(name,time() - started,**tags)
+
+    def to_list(self):
+        with self.lock:
+            return [
+                {"name": name,"tags": dict(tags),**histogram.to_dict()}
+                for (name,tags),histogram in sorted(self.histograms.items())
+            ]
+
+    def summary(self):
+        # one line per metric and tags, for reading at the end of a run
+        with self.lock:
+            summary = []
+            for (name,tags),histogram in sorted(self.histograms.items()):
+                summary.append({
+                    "name": name,
+                    "tags": dict(tags),
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "mean": histogram.sum / histogram.count if histogram.count else None,
+                    "min": histogram.min,
+                    "p50": histogram.quantile(0.5),
+                    "p90": histogram.quantile(0.9),
+                    "p99": histogram.quantile(0.99),
+                    "max": histogram.max
+                })
+
+            return summary
+
+    def prometheus(self,prefix="refinitiv_"):
+        lines = []
+        typed = set()
+
+        with self.lock:
+            for (name,tags),histogram in sorted(self.histograms.items()):
+                metric = prefix + name
+                if metric not in typed:
+                    lines.append("# TYPE %s histogram" % (metric))
+                    typed.add(metric)
+
+                labels = ["%s=\"%s\"" % (k,v.replace("\"","\\\"")) for k,v in tags]
+
+                # buckets are cumulative in the exposition format
+                bounds = [repr(float(bound)) for bound in histogram.bounds] + ["+Inf"]
+                cumulative = 0
+                for bound,count in zip(bounds,histogram.counts):
+                    cumulative += count
+                    le = "le=\"%s\"" % (bound)
+                    lines.append("%s_bucket{%s} %d" % (metric,",".join(labels + [le]),cumulative))
+
+                lines.append("%s_sum{%s} %s" % (metric,",".join(labels),repr(histogram.sum)))
+                lines.append("%s_count{%s} %d" % (metric,",".join(labels),histogram.count))
+
+        return "\n".join(lines) + "\n"
+
+    def dump(self,filepath):
+        os.makedirs(os.path.dirname(filepath) or ".",exist_ok=True)
+        with open(filepath,"w") as f:
+            json.dump(self.to_list(),f)
+
+    def merge(self,filepath):
+        # fold in the histograms dumped by another process
+        with open(filepath) as f:
+            histograms = json.load(f)
+
+        with self.lock:
+            for item in histograms:
+                self.get(item["name"],item["tags"]).merge(item)
+
+    def write_summary(self,filepath):
+        os.makedirs(os.path.dirname(filepath) or ".",exist_ok=True)
+        with open(filepath,"w") as f:
+            json.dump(self.summary(),f,indent=4)
+
+# every module in this process records into the same registry
+REGISTRY = Registry()
+
+def observe(name,value,**tags):
+    REGISTRY.observe(name,value,**tags)
+
+def timer(name,**tags):
+    return REGISTRY.timer(name,**tags)
+
+## PROMETHEUS ENDPOINT ########################################################
+
+def serve(port=9100,registry=REGISTRY):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith("/metrics.json"):
+                body = json.dumps(registry.summary()).encode()
+                content_type = "application/json"
+            else:
+                body = registry.prometheus().encode()
+                content_type = "text/plain; version=0.0.4"
+
+            self.send_response(200)
+            self.send_header("Content-Type",content_type)
+            self.send_header("Content-Length",str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self,*args):
+            # scrapes should not draw over the progress trackers
+            pass
+
+    server = ThreadingHTTPServer(("",port),MetricsHandler)
+    Thread(target=server.serve_forever,name="Metrics",daemon=True).start()
+    return server
@@ -0,0 +1,393 @@
+import refinitiv_rest
+import mock_server
+
+from refinitiv_rest import Extraction,Futures,Trades,Quotes,Depths,IntraDay,EndOfDay
+from refinitiv_rest import convert_to_utc,md5,read_extraction
+from multiprocessing import Process,Queue
+from time import time
+import resource
+import tempfile
+import shutil
+import gzip
+import json
+import sys
+import os
+
+import pandas as pd
+
+## SETTINGS ###################################################################
+
+# synthetic bulk files are kept here between runs, they take a while to make
+BENCH_DIR = "benchmark"
+BASELINE_FILE = "microbench_baseline.json"
+
+# bulk files span a typical chunk of days, and grow by adding instruments
+START_DATE = "2024-01-02"
+DAYS = 5
+BATCH_ROWS = 500000
+
+# instruments are sized from a probe of at least this many compressed bytes,
+# since a tiny probe compresses far worse than a whole file
+PROBE_BYTES = 1 << 18
+
+SIZES = {
+    "1MB": 2**20,
+    "64MB": 64 * 2**20,
+    "1GB": 2**30,
+    "5GB": 5 * 2**30
+}
+
+REPORT_TYPES = ["Trades","Quotes","Depths","IntraDay","EndOfDay"]
+DEFAULT_SIZES = ["1MB","64MB"]
+
+REPEATS = 3
+CONVERSIONS = 10000
+
+# a case fails when it is this much slower, or larger, than its baseline
+TIME_TOLERANCE = 0.2
+MEMORY_TOLERANCE = 0.25
+
+REPORTS = {
+    "Trades": Trades,
+    "Quotes": Quotes,
+    "Depths": Depths,
+    "IntraDay": IntraDay,
+    "EndOfDay": EndOfDay
+}
+
+# the request each report type sends, with its default fields
+REQUESTS = {
+    "Trades": ("TickHistoryTimeAndSalesExtractionRequest",[
+        "Trade - Price",
+        "Trade - Volume",
+        "Trade - Accumulated Volume",
+        "Trade - Sequence Number",
+        "Trade - Exchange Time"
+    ]),
+    "Quotes": ("TickHistoryTimeAndSalesExtractionRequest",[
+        "Quote - Bid Price",
+        "Quote - Bid Size",
+        "Quote - Ask Price",
+        "Quote - Ask Size",
+        "Quote - Sequence Number",
+        "Quote - Exchange Time"
+    ]),
+    "Depths": ("TickHistoryMarketDepthExtractionRequest",[
+        "Ask Price",
+        "Ask Size",
+        "Bid Price",
+        "Bid Size",
+        "Number of Buyers",
+        "Number of Sellers"
+    ]),
+    "IntraDay": ("TickHistoryIntradaySummariesExtractionRequest",[
+        "High Ask",
+        "High Ask Size",
+        "High Bid",
+        "High Bid Size",
+        "Low Ask",
+        "Low Ask Size",
+        "Low Bid",
+        "Low Bid Size",
+        "Volume"
+    ]),
+    "EndOfDay": ("ElektronTimeseriesExtractionRequest",[
+        "Trade Date",
+        "RIC",
+        "Expiration Date",
+        "Last Trading Day",
+        "Open",
+        "Settlement Price",
+        "Universal Close Price",
+        "Universal Ask Price",
+        "Universal Bid Price",
+        "Bid",
+        "Ask",
+        "Volume",
+        "Floor Volume",
+        "Open Interest"
+    ])
+}
+
+## SYNTHETIC BULK FILES #######################################################
+
+def make_extraction(report_type):
+    # nothing is requested, so no session is needed
+    return REPORTS[report_type](None,Futures("ES","US/Central"))
+
+def bulk_dates(report_type):
+    extraction = make_extraction(report_type)
+    end_date = (pd.Timestamp(START_DATE) + pd.Timedelta(days=3*DAYS)).strftime("%Y-%m-%d")
+    return extraction.request_dates(START_DATE,end_date)[0:DAYS]
+
+def bulk_request(report_type,date,rics):
+    odata_type,fieldnames = REQUESTS[report_type]
+
+    # end of day reports run on local dates, the rest on utc times
+    start_date = date + "T00:00:00.000000"
+    end_date = date + "T23:59:59.999999"
+    if report_type != "EndOfDay":
+        start_date = convert_to_utc(start_date,"US/Central")
+        end_date = convert_to_utc(end_date,"US/Central")
+
+    return {
+        "@odata.type": Extraction.odata_type + odata_type,
+        "ContentFieldNames": fieldnames,
+        "IdentifierList": {
+            "InstrumentIdentifiers": [{"Identifier": ric,"IdentifierType": "Ric"} for ric in rics]
+        },
+        "Condition": {
+            "QueryStartDate": start_date,
+            "QueryEndDate": end_date,
+            "NumberOfLevels": 10
+        }
+    }
+
+def bulk_filepath(report_type,size):
+    # cached bulk files are gzipped just as the server sends them
+    path = os.path.join(BENCH_DIR,"bulk","%s-%s.csv.gz" % (report_type,size))
+    if not os.path.exists(path):
+        make_bulk_file(report_type,SIZES[size],path)
+    return os.path.abspath(path)
+
+def probe_size(report_type,date,num_rics):
+    # compressed bytes and rows of a day of that many instruments
+    rics = ["PROBE%06d" % (i) for i in range(num_rics)]
+    probe = mock_server.synthetic_frame(bulk_request(report_type,date,rics),0)
+    return len(gzip.compress(probe.to_csv(index=False,header=False).encode())),len(probe)
+
+def make_bulk_file(report_type,target_bytes,path):
+    dates = bulk_dates(report_type)
+
+    # reports with few rows per instrument, e.g. end of day, need thousands
+    # of instruments, so the probe grows until its size says something
+    num_probe = 1
+    probe_bytes,probe_rows = probe_size(report_type,dates[0],num_probe)
+    while probe_bytes < min(PROBE_BYTES,target_bytes / len(dates)):
+        num_probe *= 2
+        probe_bytes,probe_rows = probe_size(report_type,dates[0],num_probe)
+
+    # then instruments are added until the whole file reaches the target size
+    scale = target_bytes * num_probe / (max(probe_bytes,1) * len(dates))
+    rows_per_day = mock_server.ROWS_PER_DAY
+    if scale < 1:
+        # small files thin out the ticks of a single instrument instead
+        rows_per_day = max(int(rows_per_day * scale),1)
+
+    num_rics = max(round(scale),1)
+    rics = ["BENCH%06d" % (i) for i in range(num_rics)]
+    batch = max(BATCH_ROWS * num_probe // max(probe_rows,1),1)
+
+    os.makedirs(os.path.dirname(path),exist_ok=True)
+    partial_path = path + ".part"
+    with gzip.open(partial_path,"wt",encoding="utf-8",newline="") as f:
+        header = True
+        for i,date in enumerate(dates):
+            for j in range(0,num_rics,batch):
+                request = bulk_request(report_type,date,rics[j:j+batch])
+                frame = mock_server.synthetic_frame(request,i * num_rics + j,rows_per_day)
+                if frame.empty:
+                    continue
+
+                frame.to_csv(f,index=False,header=header)
+                header = False
+
+    os.replace(partial_path,path)
+
+## CASES ######################################################################
+
+def best_time(func,repeats=REPEATS,setup=None,teardown=None):
+    # the fastest of a few runs is the least disturbed by everything else
+    best = None
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+
+        timer = time()
+        func()
+        elapsed_time = time() - timer
+
+        if teardown is not None:
+            teardown()
+
+        best = elapsed_time if best is None else min(best,elapsed_time)
+
+    return best
+
+def split_files_case(report_type,filepath):
+    extraction = make_extraction(report_type)
+    dates = bulk_dates(report_type)
+    filename = "%s-%s.csv.gz" % (dates[0],dates[-1])
+
+    def setup():
+        shutil.copy(filepath,os.path.join(extraction.get_output_filepath(),filename))
+
+    def teardown():
+        shutil.rmtree(refinitiv_rest.DATA_DIR)
+
+    return best_time(lambda: extraction.split_files(filename),setup=setup,teardown=teardown)
+
+def read_extraction_case(report_type,filepath):
+    return best_time(lambda: read_extraction(filepath,report_type))
+
+def md5_case(report_type,filepath):
+    return best_time(lambda: md5(filepath))
+
+def gzip_write_case(report_type,filepath):
+    # compress line by line, the way daily files are written
+    plain_path = os.path.abspath("bulk.csv")
+    with gzip.open(filepath,"rb") as src,open(plain_path,"wb") as dst:
+        shutil.copyfileobj(src,dst)
+
+    def write():
+        with open(plain_path,encoding="utf-8",newline="") as src:
+            with gzip.open("bulk.csv.gz","wt",encoding="utf-8",newline="") as dst:
+                for line in src:
+                    dst.write(line)
+
+    return best_time(write)
+
+def convert_to_utc_case(report_type,filepath):
+    stamps = [
+        "2024-%02d-%02dT%02d:30:00.000000" % (1 + i % 12,1 + i % 28,i % 24)
+        for i in range(CONVERSIONS)
+    ]
+
+    def convert():
+        for stamp in stamps:
+            convert_to_utc(stamp,"US/Central")
+
+    return best_time(convert)
+
+CASES = {
+    "split_files": split_files_case,
+    "read_extraction": read_extraction_case,
+    "md5": md5_case,
+    "gzip_write": gzip_write_case,
+    "convert_to_utc": convert_to_utc_case
+}
+
+## MEASUREMENT ################################################################
+
+def measure(function,report_type,size,filepath,results):
+    workdir = tempfile.mkdtemp(prefix="case-",dir=os.path.abspath(BENCH_DIR))
+    os.chdir(workdir)
+
+    seconds = CASES[function](report_type,filepath)
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    nbytes = None if filepath is None else os.path.getsize(filepath)
+
+    results.put({
+        "function": function,
+        "report_type": report_type,
+        "size": size,
+        "seconds": seconds,
+        "file_mb": None if nbytes is None else nbytes / 2**20,
+        "mb_per_sec": None if nbytes is None else nbytes / 1e6 / seconds,
+        "peak_rss_mb": usage.ru_maxrss / 1024
+    })
+
+    shutil.rmtree(workdir)
+
+def run_case(function,report_type=None,size=None,filepath=None):
+    # a fresh process per case, so the peak memory is that case's alone
+    results = Queue()
+    case = Process(
+        target = measure,
+        args = (function,report_type,size,filepath,results),
+        name = "Microbench"
+    )
+
+    case.start()
+    case.join()
+
+    # a case that crashed has nothing to report
+    if case.exitcode != 0:
+        raise RuntimeError("%s case failed with exit code %s" % (function,case.exitcode))
+
+    return results.get()
+
+def run_microbench(report_types=REPORT_TYPES,sizes=DEFAULT_SIZES):
+    os.makedirs(BENCH_DIR,exist_ok=True)
+    results = [run_case("convert_to_utc")]
+    for report_type in report_types:
+        for size in sizes:
+            filepath = bulk_filepath(report_type,size)
+            for function in ["split_files","read_extraction","md5","gzip_write"]:
+                results.append(run_case(function,report_type,size,filepath))
+
+    return results
+
+## BASELINE ###################################################################
+
+def case_key(result):
+    return "%s/%s/%s" % (result["function"],result["report_type"],result["size"])
+
+def load_baseline(path=None):
+    path = os.path.join(BENCH_DIR,BASELINE_FILE) if path is None else path
+    if not os.path.exists(path):
+        return None
+
+    with open(path) as f:
+        return json.load(f)
+
+def save_baseline(results,path=None):
+    path = os.path.join(BENCH_DIR,BASELINE_FILE) if path is None else path
+    os.makedirs(os.path.dirname(path),exist_ok=True)
+    with open(path,"w") as f:
+        json.dump({case_key(result): result for result in results},f,indent=4)
+
+def compare(results,baseline,time_tolerance=TIME_TOLERANCE,memory_tolerance=MEMORY_TOLERANCE):
+    # cases without a baseline are new, so they cannot regress
+    regressions = []
+    for result in results:
+        previous = baseline.get(case_key(result))
+        if previous is None:
+            continue
+
+        result["baseline_seconds"] = previous["seconds"]
+        result["baseline_rss_mb"] = previous["peak_rss_mb"]
+
+        if result["seconds"] > previous["seconds"] * (1 + time_tolerance):
+            regressions.append((case_key(result),"seconds",previous["seconds"],result["seconds"]))
+        if result["peak_rss_mb"] > previous["peak_rss_mb"] * (1 + memory_tolerance):
+            regressions.append((case_key(result),"peak_rss_mb",previous["peak_rss_mb"],result["peak_rss_mb"]))
+
+    return regressions
+
+def print_results(results):
+    # sizes name the target of each bulk file, the file MB column is its
+    # actual size
+    columns = "%-32s %9s %9s %9s %9s %9s"
+    print(columns % ("case","file MB","seconds","baseline","MB/s","RSS MB"))
+    for result in results:
+        baseline = result.get("baseline_seconds")
+        print(columns % (
+            case_key(result),
+            "" if result.get("file_mb") is None else "%.2f" % (result["file_mb"]),
+            "%.3f" % (result["seconds"]),
+            "" if baseline is None else "%.3f" % (baseline),
+            "" if result["mb_per_sec"] is None else "%.1f" % (result["mb_per_sec"]),
+            "%.1f" % (result["peak_rss_mb"])
+        ))
+
+## MAIN #######################################################################
+
+if __name__ == "__main__":
+    # the first run on a machine becomes its baseline, pass --update to
+    # replace the baseline after an intended change
+    results = run_microbench()
+    baseline = load_baseline()
+
+    if baseline is None or "--update" in sys.argv:
+        save_baseline(results)
+        print_results(results)
+        sys.exit(0)
+
+    regressions = compare(results,baseline)
+    print_results(results)
+
+    for key,measure_name,previous,current in regressions:
+        print("REGRESSION %s: %s went from %.3f to %.3f" % (key,measure_name,previous,current))
+
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,482 @@
+from http.server import BaseHTTPRequestHandler,ThreadingHTTPServer
+from multiprocessing import Process
+from collections import OrderedDict
+from threading import Lock
+from time import time,sleep
+import numpy as np
+import pandas as pd
+import socket
+import json
+import gzip
+import re
+
+## SETTINGS ###################################################################
+
+# the api lives under the same path as the real one
+MOCK_PORT = 8765
+MOCK_PATH = "/RestApi/v1/"
+
+# how long a job stays in the queue, and how much data each one returns
+EXTRACTION_DELAY = 2
+ROWS_PER_DAY = 20000
+CONTRACTS = 2
+NUM_LEVELS = 10
+
+# share of calls answered with "too many requests", and the pause it asks for
+THROTTLE_RATE = 0.0
+THROTTLE_PAUSE = 1
+
+# reports kept in memory for range requests, oldest dropped first
+CACHED_REPORTS = 16
+
+def mock_url(port=MOCK_PORT,host="127.0.0.1"):
+    return "http://%s:%d%s" % (host,port,MOCK_PATH)
+
+## SYNTHETIC REPORTS ##########################################################
+
+# column names as they appear in the headers of tick history reports
+FIELD_COLUMNS = {
+    "Accumulated Volume": "Acc. Volume",
+    "Sequence Number": "Seq. No.",
+    "Exchange Time": "Exch Time"
+}
+
+DEPTH_COLUMNS = [
+    ("Bid Price","BidPrice"),
+    ("Bid Size","BidSize"),
+    ("Number of Buyers","BuyNo"),
+    ("Ask Price","AskPrice"),
+    ("Ask Size","AskSize"),
+    ("Number of Sellers","SellNo")
+]
+
+TICK_SIZE = 0.25
+MONTH_CODES = "HMUZ"
+
+def contract_rics(identifier,year,contracts=CONTRACTS):
+    # a chain resolves to its first few quarterly contracts
+    if not identifier.startswith("0#"):
+        return [identifier]
+
+    root = identifier[2:].rstrip(":")
+    return ["%s%s%d" % (root,MONTH_CODES[i % 4],(year + i // 4) % 10) for i in range(contracts)]
+
+def request_rics(request,year,contracts=CONTRACTS):
+    rics = {}
+    for item in request["IdentifierList"].get("InstrumentIdentifiers",[]):
+        for ric in contract_rics(item["Identifier"],year,contracts):
+            rics.setdefault(ric,None)
+    return list(rics)
+
+def query_window(condition):
+    window = []
+    for key in ["QueryStartDate","QueryEndDate"]:
+        timestamp = pd.Timestamp(condition[key])
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.tz_convert(None)
+        window.append(timestamp)
+    return window
+
+def field_values(field,mid,rng):
+    # sizes and counts are integers, anything else is priced near the mid
+    if any(word in field for word in ["Size","Volume","Interest","Number"]):
+        return rng.integers(1,200,len(mid))
+    return np.round(mid + TICK_SIZE * rng.integers(-4,5,len(mid)),2)
+
+def price_path(rng,rows,paths=1):
+    # random walks on the tick grid, one after another
+    steps = rng.choice([-TICK_SIZE,0,TICK_SIZE],(paths,rows),p=[0.2,0.6,0.2])
+    return (4500 + np.cumsum(steps,axis=1)).ravel()
+
+def tick_times(rng,start,end,rows):
+    nanos = np.sort(rng.integers(start.value,end.value,rows))
+    stamps = np.datetime_as_string(nanos.astype("datetime64[ns]"),unit="ns")
+    return np.char.add(stamps,"Z")
+
+def time_and_sales(request,rng,rows_per_day,contracts):
+    start,end = query_window(request["Condition"])
+    fields = request["ContentFieldNames"]
+    kind = "Quote" if any(field.startswith("Quote") for field in fields) else "Trade"
+    rows = max(int(rows_per_day * (end - start) / pd.Timedelta(days=1)),1)
+
+    frames = []
+    for ric in request_rics(request,start.year,contracts):
+        stamps = tick_times(rng,start,end,rows)
+        mid = price_path(rng,rows)
+        frame = {"#RIC": ric,"Domain": "Market Price","Date-Time": stamps,"GMT Offset": -6,"Type": kind}
+
+        for field in fields:
+            name = field.split(" - ",1)[-1]
+            column = FIELD_COLUMNS.get(name,name)
+            if name == "Bid Price":
+                frame[column] = mid - TICK_SIZE
+            elif name == "Ask Price":
+                frame[column] = mid + TICK_SIZE
+            elif name == "Price":
+                frame[column] = mid
+            elif name == "Sequence Number":
+                frame[column] = np.arange(1,rows+1)
+            elif name == "Accumulated Volume":
+                frame[column] = np.cumsum(rng.integers(1,50,rows))
+            elif name == "Exchange Time":
+                frame[column] = np.char.rstrip(np.char.partition(stamps,"T")[:,2],"Z")
+            else:
+                frame[column] = field_values(name,mid,rng)
+
+        frames.append(pd.DataFrame(frame))
+
+    return pd.concat(frames)
+
+def market_depth(request,rng,rows_per_day,contracts):
+    start,end = query_window(request["Condition"])
+    fields = set(request["ContentFieldNames"])
+    levels = int(request["Condition"].get("NumberOfLevels",NUM_LEVELS))
+    rows = max(int(rows_per_day * (end - start) / pd.Timedelta(days=1)),1)
+
+    frames = []
+    for ric in request_rics(request,start.year,contracts):
+        mid = price_path(rng,rows)
+        frame = {
+            "#RIC": ric,
+            "Domain": "Market Price",
+            "Date-Time": tick_times(rng,start,end,rows),
+            "GMT Offset": -6,
+            "Type": "Market Price"
+        }
+
+        # the normalized view lays out every level side by side
+        for level in range(1,levels+1):
+            for field,suffix in DEPTH_COLUMNS:
+                if field not in fields:
+                    continue
+
+                column = "L%d-%s" % (level,suffix)
+                if field == "Bid Price":
+                    frame[column] = mid - TICK_SIZE * level
+                elif field == "Ask Price":
+                    frame[column] = mid + TICK_SIZE * level
+                else:
+                    frame[column] = rng.integers(1,200,rows)
+
+        frames.append(pd.DataFrame(frame))
+
+    return pd.concat(frames)
+
+def intraday_summaries(request,rng,rows_per_day,contracts):
+    start,end = query_window(request["Condition"])
+    stamps = pd.date_range(start.ceil("h"),end,freq="h")
+    stamps = np.char.add(np.datetime_as_string(stamps.values,unit="ns"),"Z")
+
+    # every instrument at once, as a request may hold thousands of them
+    rics = request_rics(request,start.year,contracts)
+    mid = price_path(rng,len(stamps),len(rics))
+    frame = {
+        "#RIC": np.repeat(rics,len(stamps)),
+        "Domain": "Market Price",
+        "Date-Time": np.tile(stamps,len(rics)),
+        "GMT Offset": -6,
+        "Type": "Intraday 1Hour"
+    }
+    for field in request["ContentFieldNames"]:
+        frame[field] = field_values(field,mid,rng)
+
+    return pd.DataFrame(frame)
+
+def end_of_day(request,rng,rows_per_day,contracts):
+    start,end = query_window(request["Condition"])
+    dates = pd.bdate_range(start.normalize(),end.normalize())
+
+    rics = request_rics(request,start.year,contracts)
+    mid = price_path(rng,len(dates),len(rics))
+    frame = {}
+    for field in request["ContentFieldNames"]:
+        if field == "Trade Date":
+            frame[field] = np.tile(dates.strftime("%Y-%m-%d"),len(rics))
+        elif field == "RIC":
+            frame[field] = np.repeat(rics,len(dates))
+        elif "Date" in field or "Day" in field:
+            frame[field] = (start + pd.DateOffset(months=3)).strftime("%Y-%m-%d")
+        else:
+            frame[field] = field_values(field,mid,rng)
+
+    return pd.DataFrame(frame,index=range(len(mid)))
+
+REPORTS = {
+    "TickHistoryTimeAndSalesExtractionRequest": time_and_sales,
+    "TickHistoryMarketDepthExtractionRequest": market_depth,
+    "TickHistoryIntradaySummariesExtractionRequest": intraday_summaries,
+    "ElektronTimeseriesExtractionRequest": end_of_day
+}
+
+def synthetic_frame(request,seed,rows_per_day=ROWS_PER_DAY,contracts=CONTRACTS):
+    report_type = request["@odata.type"].split(".")[-1]
+    rng = np.random.default_rng(seed)
+    return REPORTS[report_type](request,rng,rows_per_day,contracts)
+
+def synthetic_report(request,seed,rows_per_day=ROWS_PER_DAY,contracts=CONTRACTS):
+    # the same request and seed always give the same bytes, so a resumed
+    # download lines up with what was already written
+    frame = synthetic_frame(request,seed,rows_per_day,contracts)
+    if frame.empty:
+        return b""
+
+    return gzip.compress(frame.to_csv(index=False).encode(),mtime=0)
+
+## MOCK SERVER ################################################################
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self,port=MOCK_PORT,delay=EXTRACTION_DELAY,rows_per_day=ROWS_PER_DAY,
+            contracts=CONTRACTS,throttle_rate=THROTTLE_RATE):
+        ThreadingHTTPServer.__init__(self,("127.0.0.1",port),MockHandler)
+        self.delay = delay
+        self.rows_per_day = rows_per_day
+        self.contracts = contracts
+        self.throttle_rate = throttle_rate
+        self.rng = np.random.default_rng()
+
+        self.lock = Lock()
+        self.tokens = set()
+        self.jobs = {}
+        self.reports = OrderedDict()
+
+    def issue_token(self):
+        with self.lock:
+            token = "%032x" % (self.rng.integers(1 << 62))
+            self.tokens.add(token)
+            return token
+
+    def create_job(self,request):
+        with self.lock:
+            job_id = "0x%016x" % (len(self.jobs) + 1)
+            self.jobs[job_id] = {"request": request,"created": time()}
+            return job_id
+
+    def report(self,job_id):
+        with self.lock:
+            if job_id in self.reports:
+                self.reports.move_to_end(job_id)
+                return self.reports[job_id]
+
+        # build outside the lock, so other jobs are not held up
+        job = self.jobs[job_id]
+        seed = int(job_id,16)
+        content = synthetic_report(job["request"],seed,self.rows_per_day,self.contracts)
+
+        with self.lock:
+            self.reports[job_id] = content
+            while len(self.reports) > CACHED_REPORTS:
+                self.reports.popitem(last=False)
+
+        return content
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self,*args):
+        # the trackers own the terminal
+        pass
+
+    def reply(self,status,body=None,headers=None):
+        content = b"" if body is None else json.dumps(body).encode()
+
+        self.send_response(status)
+        self.send_header("Content-Type","application/json; charset=utf-8")
+        self.send_header("Content-Length",str(len(content)))
+        for key,value in (headers or {}).items():
+            self.send_header(key,value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length",0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def route(self,method):
+        # the body has to be read off a kept alive connection either way
+        self.body = self.read_body()
+
+        if not self.path.startswith(MOCK_PATH):
+            return self.reply(404,{"error": {"message": "Not found"}})
+
+        endpoint = self.path[len(MOCK_PATH):]
+        server = self.server
+
+        if server.throttle_rate and server.rng.random() < server.throttle_rate:
+            return self.reply(
+                429,
+                {"error": {"message": "Too many requests"}},
+                {"Retry-After": str(THROTTLE_PAUSE)}
+            )
+
+        if endpoint == "Authentication/RequestToken":
+            return self.reply(200,{"value": server.issue_token()})
+
+        # everything else needs a token this server handed out
+        token = self.headers.get("Authorization","").replace("Token ","",1)
+        if token not in server.tokens:
+            return self.reply(401,{"error": {"message": "Authorization has been denied"}})
+
+        for pattern,handler in ROUTES:
+            match = re.fullmatch(pattern,endpoint)
+            if match is not None:
+                return handler(self,method,*match.groups())
+
+        return self.reply(404,{"error": {"message": "Unknown endpoint %s" % (endpoint)}})
+
+    def do_GET(self):
+        self.route("GET")
+
+    def do_POST(self):
+        self.route("POST")
+
+    def users(self,method,username):
+        return self.reply(200,{"UserId": username,"UserName": "Mock User","Email": ""})
+
+    def quota(self,method):
+        return self.reply(200,{"value": [{
+            "QuotaCategoryCode": "TickHistoryExtraction",
+            "QuotaCategoryName": "Tick History Extraction",
+            "QuotaLimit": None,
+            "QuotaUsed": len(self.server.jobs)
+        }]})
+
+    def content_fields(self,method,template):
+        return self.reply(200,{"value": [
+            {"FieldGroup": "Trade","Name": "Trade - Price"},
+            {"FieldGroup": "Trade","Name": "Trade - Volume"},
+            {"FieldGroup": "Quote","Name": "Quote - Bid Price"},
+            {"FieldGroup": "Quote","Name": "Quote - Ask Price"},
+            {"FieldGroup": " ","Name": "Bid Price"},
+            {"FieldGroup": " ","Name": "Ask Price"}
+        ]})
+
+    def extract_raw(self,method):
+        request = self.body["ExtractionRequest"]
+        if request["@odata.type"].split(".")[-1] not in REPORTS:
+            return self.reply(400,{"error": {"message": "Unsupported report %s" % (request["@odata.type"])}})
+
+        job_id = self.server.create_job(request)
+        location = "%sExtractions/ExtractRawResult(ExtractionId='%s')" % (
+            mock_url(self.server.server_address[1]),job_id
+        )
+        return self.reply(202,headers={"Location": location})
+
+    def extract_raw_result(self,method,job_id):
+        job = self.server.jobs.get(job_id)
+        if job is None:
+            return self.reply(404,{"error": {"message": "Unknown job %s" % (job_id)}})
+
+        elapsed = time() - job["created"]
+        if elapsed < self.server.delay:
+            location = mock_url(self.server.server_address[1]) + self.path[len(MOCK_PATH):]
+            return self.reply(202,headers={"Location": location})
+
+        # the server reports its own extraction time in the notes
+        notes = "Processing completed successfully at %s, taking %.3f Sec." % (
+            pd.Timestamp.now().strftime("%m/%d/%Y %H:%M:%S"),self.server.delay / 2
+        )
+        return self.reply(200,{"JobId": job_id,"Notes": [notes]})
+
+    def raw_results(self,method,job_id):
+        if job_id not in self.server.jobs:
+            return self.reply(404,{"error": {"message": "Unknown job %s" % (job_id)}})
+
+        content = self.server.report(job_id)
+        status = 200
+        start = 0
+
+        # resume from a byte offset like the file store does
+        match = re.fullmatch(r"bytes=(\d+)-",self.headers.get("Range",""))
+        if match is not None and int(match.group(1)) < len(content):
+            start = int(match.group(1))
+            status = 206
+
+        self.send_response(status)
+        self.send_header("Content-Type","text/plain")
+        self.send_header("Content-Length",str(len(content) - start))
+        if status == 206:
+            self.send_header("Content-Range","bytes %d-%d/%d" % (start,len(content)-1,len(content)))
+        self.end_headers()
+        self.wfile.write(content[start:])
+
+    def chain_resolution(self,method):
+        request = self.body["Request"]
+        year = pd.Timestamp(request["Range"]["Start"]).year
+        return self.reply(200,{"value": [
+            {
+                "Identifier": chain,
+                "Constituents": [
+                    {"Identifier": ric,"IdentifierType": "Ric"}
+                    for ric in contract_rics(chain,year,self.server.contracts)
+                ]
+            }
+            for chain in request["ChainRics"]
+        ]})
+
+    def historical_search(self,method):
+        request = self.body["Request"]
+        return self.reply(200,{"value": [{
+            "Identifier": request["Identifier"],
+            "IdentifierType": "Ric",
+            "Source": "",
+            "Key": request["Identifier"],
+            "Description": "Mock instrument",
+            "InstrumentType": "Unknown",
+            "Status": "Valid",
+            "DomainCode": "6",
+            "FirstDate": request["Range"]["Start"],
+            "LastDate": request["Range"]["End"]
+        }]})
+
+    def instrument_search(self,method):
+        request = self.body["SearchRequest"]
+        return self.reply(200,{"value": [{
+            "Identifier": request["Identifier"],
+            "IdentifierType": "Ric",
+            "Description": "Mock instrument",
+            "InstrumentType": "FuturesAndOptions",
+            "Status": "Valid"
+        }]})
+
+ROUTES = [
+    (r"Users/Users\((.*)\)",MockHandler.users),
+    (r"Quota/GetQuotaInformation",MockHandler.quota),
+    (r"Extractions/GetValidContentFieldTypes\(ReportTemplateType=(.*)\)",MockHandler.content_fields),
+    (r"Extractions/ExtractRaw",MockHandler.extract_raw),
+    (r"Extractions/ExtractRawResult\(ExtractionId='(.*)'\)",MockHandler.extract_raw_result),
+    (r"Extractions/RawExtractionResults\('(.*)'\)/\$value",MockHandler.raw_results),
+    (r"Search/HistoricalChainResolution",MockHandler.chain_resolution),
+    (r"Search/HistoricalSearch",MockHandler.historical_search),
+    (r"Search/InstrumentSearch",MockHandler.instrument_search)
+]
+
+def run_server(port=MOCK_PORT,**options):
+    server = MockServer(port,**options)
+    server.serve_forever()
+
+def start_server(port=MOCK_PORT,**options):
+    # a process of its own, so serving does not count against the client
+    server = Process(target=run_server,args=(port,),kwargs=options,name="MockServer",daemon=True)
+    server.start()
+
+    # wait until the port accepts connections
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1",port),timeout=1).close()
+            break
+        except OSError:
+            sleep(0.05)
+
+    return server
+
+def stop_server(server):
+    server.terminate()
+    server.join()
+
+## MAIN #######################################################################
+
+if __name__ == "__main__":
+    print("Serving a mock DataScope Select API on %s" % (mock_url()))
+    run_server()
@@ -0,0 +1,205 @@
+from refinitiv_rest import *
+from reader import load,read_partition
+import numpy as np
+
+## SETTINGS ###################################################################
+
+# sides of the book along the last axis of the price and size arrays
+SIDES = ("Bid","Ask")
+BID,ASK = 0,1
+
+# the columns of each level and side in a NormalizedLL2 depth report
+BOOK_FIELDS = {
+    "prices": ("BidPrice","AskPrice"),
+    "sizes": ("BidSize","AskSize"),
+    "orders": ("BuyNo","SellNo")
+}
+
+## BOOK CLASS #################################################################
+
+class Book:
+    def __init__(self,ric,times,prices,sizes,orders=None):
+        # times are utc nanoseconds, and prices, sizes and orders are arrays
+        # shaped (events,levels,side) with nan for empty levels
+        self.ric = ric
+        self.times = times
+        self.prices = prices
+        self.sizes = sizes
+        self.orders = orders
+
+    def __len__(self):
+        return len(self.times)
+
+    def __repr__(self):
+        return "Book(%s, %d events, %d levels)" % (self.ric,len(self),self.levels)
+
+    @property
+    def levels(self):
+        return self.prices.shape[1]
+
+    @property
+    def index(self):
+        return pd.DatetimeIndex(self.times,tz="UTC",name="Date-Time")
+
+    ## DERIVED SERIES #########################################################
+
+    def best(self,side):
+        return self.prices[:,0,side],self.sizes[:,0,side]
+
+    def mid(self):
+        return (self.prices[:,0,BID] + self.prices[:,0,ASK]) / 2
+
+    def spread(self):
+        return self.prices[:,0,ASK] - self.prices[:,0,BID]
+
+    def microprice(self):
+        # the mid weighted towards the side with less size at the top
+        bid_price,bid_size = self.best(BID)
+        ask_price,ask_size = self.best(ASK)
+        with np.errstate(invalid="ignore",divide="ignore"):
+            return (bid_price * ask_size + ask_price * bid_size) / (bid_size + ask_size)
+
+    def depth(self,levels=None,side=None):
+        # total size over the first levels, of one side or both
+        sizes = np.nansum(self.sizes[:,0:levels],axis=1)
+        return sizes if side is None else sizes[:,side]
+
+    def imbalance(self,levels=1):
+        # (bid - ask) / (bid + ask) of the size over the first levels
+        depth = self.depth(levels)
+        with np.errstate(invalid="ignore",divide="ignore"):
+            return (depth[:,BID] - depth[:,ASK]) / (depth[:,BID] + depth[:,ASK])
+
+    def features(self,levels=(1,5)):
+        columns = {
+            "mid": self.mid(),
+            "microprice": self.microprice(),
+            "spread": self.spread()
+        }
+        for n in levels:
+            columns["imbalance_%d" % (n)] = self.imbalance(n)
+
+        return pd.DataFrame(columns,index=self.index)
+
+    ## SAMPLING ###############################################################
+
+    def sample(self,grid):
+        # the book in force at each time of the grid, i.e. the last event at
+        # or before it; grid times before the first event have empty books
+        grid = np.asarray(to_nanoseconds(grid))
+        positions = np.searchsorted(self.times,grid,side="right") - 1
+        before = positions < 0
+        positions[before] = 0
+
+        def take(values):
+            if values is None:
+                return None
+            elif len(self) == 0:
+                return np.full((len(grid),*values.shape[1:]),np.nan)
+            sampled = values[positions]
+            sampled[before] = np.nan
+            return sampled
+
+        return Book(self.ric,grid,take(self.prices),take(self.sizes),take(self.orders))
+
+    def resample(self,frequency,start=None,end=None):
+        # snapshots on a fixed grid, by default spanning every event
+        if len(self) == 0:
+            return self.sample(np.array([],dtype="datetime64[ns]"))
+
+        start = self.index[0].floor(frequency) if start is None else start
+        end = self.index[-1].ceil(frequency) if end is None else end
+        return self.sample(pd.date_range(start,end,freq=frequency))
+
+## CONSTRUCTION ###############################################################
+
+def book_columns(levels=DEPTH_LEVELS,orders=False):
+    fields = ["prices","sizes"] + (["orders"] if orders else [])
+    return [
+        "L%d-%s" % (level,column)
+        for level in range(1,levels+1)
+        for field in fields
+        for column in BOOK_FIELDS[field]
+    ]
+
+def to_nanoseconds(times):
+    # utc datetime64[ns] values of timestamps, naive ones taken as utc
+    index = pd.DatetimeIndex(times)
+    if index.tz is not None:
+        index = index.tz_convert("UTC").tz_localize(None)
+    return index.as_unit("ns").values
+
+def stack(frame,field,levels):
+    # one contiguous (events,levels,side) block from the per level columns
+    bid,ask = BOOK_FIELDS[field]
+    values = np.empty((len(frame),levels,2),dtype="float64")
+    for level in range(levels):
+        for side,name in [(BID,bid),(ASK,ask)]:
+            column = frame["L%d-%s" % (level+1,name)]
+            values[:,level,side] = column.to_numpy(dtype="float64",na_value=np.nan)
+    return values
+
+def books_from_frame(frame,levels=DEPTH_LEVELS,orders=False):
+    # rows are grouped by RIC with a stable sort, so each book keeps the order
+    # in which its updates were reported
+    if frame.empty:
+        return {}
+
+    rics = frame[Extraction.ric_col].astype("category")
+    codes = rics.cat.codes.to_numpy()
+    order = np.argsort(codes,kind="stable")
+    times = to_nanoseconds(frame[Extraction.date_col])[order]
+
+    prices = stack(frame,"prices",levels)[order]
+    sizes = stack(frame,"sizes",levels)[order]
+    counts = stack(frame,"orders",levels)[order] if orders else None
+
+    books = {}
+    bounds = np.searchsorted(codes[order],np.arange(len(rics.cat.categories)+1))
+    for code,ric in enumerate(rics.cat.categories):
+        start,end = bounds[code],bounds[code+1]
+        if start == end:
+            continue
+
+        # reports are ordered by time already, but sort any stragglers
+        book_slice = slice(start,end)
+        book_times = times[book_slice]
+        resort = None
+        if np.any(book_times[1:] < book_times[:-1]):
+            resort = np.argsort(book_times,kind="stable")
+
+        def part(values):
+            if values is None:
+                return None
+            values = values[book_slice]
+            return np.ascontiguousarray(values if resort is None else values[resort])
+
+        books[ric] = Book(ric,part(times),part(prices),part(sizes),part(counts))
+
+    return books
+
+def read_books(filepath,levels=DEPTH_LEVELS,rics=None,orders=False):
+    # the books of every RIC (or the given ones) in one daily depth file
+    # sizes are held as floats anyway, which parse far faster than nullable
+    # integers
+    columns = [Extraction.ric_col,Extraction.date_col,*book_columns(levels,orders)]
+    frame = read_partition(filepath,"Depths",columns,dict.fromkeys(columns[2:],"float64"))
+
+    if rics is not None:
+        frame = frame[frame[Extraction.ric_col].isin(rics)]
+
+    return books_from_frame(frame,levels,orders)
+
+def load_books(security,start,end=None,rics=None,levels=DEPTH_LEVELS,orders=False):
+    # the books of a security between two times, from its stored depth files
+    columns = [Extraction.ric_col,Extraction.date_col,*book_columns(levels,orders)]
+    frame = load(security,"Depths",start,end,columns=columns,rics=rics)
+    return books_from_frame(frame,levels,orders)
+
+## MAIN #######################################################################
+
+if __name__ == "__main__":
+    ## one second snapshots of the front contract over a day
+    books = load_books(Futures("ES","US/Central"),"2024-01-02",rics=["ESH4"])
+    snapshots = books["ESH4"].resample("1s")
+    print(snapshots.features())
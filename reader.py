@@ -0,0 +1,195 @@
+from refinitiv_rest import *
+
+## SETTINGS ###################################################################
+
+# rows parsed at a time from csv files, before filtering
+READ_CHUNK_ROWS = 1000000
+
+# a date may have been written in any of these formats
+PARTITION_EXTENSIONS = [".parquet",".csv.gz",".csv.zst",".csv.lz4",".csv"]
+
+REPORT_COLUMNS = {
+    "EndOfDay": ("Trade Date","RIC")
+}
+
+## PARTITIONS #################################################################
+
+def report_columns(report_type):
+    # the timestamp and RIC columns of a report
+    return REPORT_COLUMNS.get(report_type,(Extraction.date_col,Extraction.ric_col))
+
+def time_range(security,report_type,start,end=None):
+    # naive times are local to the security, and a bare end date runs to
+    # the end of that day
+    if end is None:
+        end = pd.Timestamp(start).normalize() + pd.Timedelta(days=1) - pd.Timedelta(1)
+    elif isinstance(end,str) and len(end) == 10:
+        end = pd.Timestamp(end) + pd.Timedelta(days=1) - pd.Timedelta(1)
+
+    bounds = []
+    for timestamp in [pd.Timestamp(start),pd.Timestamp(end)]:
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.tz_localize(security.timezone)
+        bounds.append(timestamp)
+
+    # end of day reports are dated in local time, everything else in utc
+    if report_type == "EndOfDay":
+        return [timestamp.tz_localize(None).normalize() for timestamp in bounds]
+    return [timestamp.tz_convert("UTC") for timestamp in bounds]
+
+def daily_files(security,report_type,dates,records=None):
+    # the file held for each date, from the catalog when it knows the date
+    # and otherwise from whichever format is found on disk
+    directory = data_path(security.base_ric,report_type)
+    if records is None:
+        records = Catalog().files(security.base_ric,report_type,dates[0],dates[-1]) if len(dates) else {}
+
+    filepaths = {}
+    for date in dates:
+        record = records.get(date)
+        if record is not None and (record["file"] is None or os.path.exists(record["file"])):
+            if record["file"] is not None:
+                filepaths[date] = record["file"]
+            continue
+
+        for extension in PARTITION_EXTENSIONS:
+            filepath = os.path.join(directory,date + extension)
+            if os.path.exists(filepath):
+                filepaths[date] = filepath
+                break
+
+    return filepaths
+
+def partitions(security,report_type,start,end,rics=None):
+    # every daily file holds one local day of the venue, so utc times are
+    # looked up on the local dates they fall on
+    first,last = start,end
+    if report_type != "EndOfDay":
+        first,last = start.tz_convert(security.timezone),end.tz_convert(security.timezone)
+
+    dates = pd.date_range(first.strftime("%Y-%m-%d"),last.strftime("%Y-%m-%d")).strftime("%Y-%m-%d")
+    if len(dates) == 0:
+        return []
+
+    # catalogued days are pruned on the times and RICs they hold, without
+    # opening them
+    catalog = Catalog()
+    records = catalog.files(security.base_ric,report_type,dates[0],dates[-1])
+    matching = catalog.matching(security.base_ric,report_type,start,end,rics) if records else set()
+
+    return [
+        filepath for date,filepath in daily_files(security,report_type,dates,records).items()
+        if date not in records or date in matching
+    ]
+
+## READING ####################################################################
+
+def read_partition(filepath,report_type,columns=None,dtype=None):
+    # one whole daily file in either format, skipping columns it does not have
+    if filepath.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        names = pq.read_schema(filepath).names
+        columns = None if columns is None else [column for column in columns if column in names]
+        frame = pd.read_parquet(filepath,columns=columns)
+        dtype = {column: kind for column,kind in (dtype or {}).items() if column in frame.columns}
+        return frame.astype(dtype)
+
+    return read_extraction(filepath,report_type,usecols=columns,dtype=dtype or {})
+
+def iter_partition(filepath,report_type,columns=None,dtype=None,chunksize=READ_CHUNK_ROWS):
+    # the same, a chunk of rows at a time
+    if filepath.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        parquet = pq.ParquetFile(filepath)
+        names = parquet.schema_arrow.names
+        columns = None if columns is None else [column for column in columns if column in names]
+        for batch in parquet.iter_batches(batch_size=chunksize,columns=columns):
+            frame = batch.to_pandas()
+            yield frame.astype({column: kind for column,kind in (dtype or {}).items() if column in frame.columns})
+        return
+
+    yield from read_extraction(filepath,report_type,usecols=columns,dtype=dtype or {},chunksize=chunksize)
+
+def read_csv_partition(filepath,report_type,columns,start,end,rics,chunksize):
+    date_col,ric_col = report_columns(report_type)
+    usecols = None if columns is None else list(dict.fromkeys([*columns,date_col,ric_col]))
+
+    for chunk in read_extraction(filepath,report_type,usecols=usecols,chunksize=chunksize):
+        mask = (chunk[date_col] >= start) & (chunk[date_col] <= end)
+        if rics is not None:
+            mask &= chunk[ric_col].isin(rics)
+
+        chunk = chunk[mask]
+        if columns is not None:
+            chunk = chunk[columns]
+
+        if not chunk.empty:
+            yield chunk
+
+def read_parquet_partitions(filepaths,report_type,columns,start,end,rics,chunksize):
+    import pyarrow.dataset as ds
+
+    # row groups whose statistics fall outside the filter are never read
+    date_col,ric_col = report_columns(report_type)
+    expression = (ds.field(date_col) >= start) & (ds.field(date_col) <= end)
+    if rics is not None:
+        expression &= ds.field(ric_col).isin(list(rics))
+
+    dataset = ds.dataset(filepaths,format="parquet")
+    for batch in dataset.to_batches(columns=columns,filter=expression,batch_size=chunksize):
+        if batch.num_rows > 0:
+            yield batch.to_pandas()
+
+def iter_chunks(security,report_type,start,end=None,columns=None,rics=None,chunksize=READ_CHUNK_ROWS):
+    start,end = time_range(security,report_type,start,end)
+    rics = None if rics is None else set(rics)
+
+    # a universe reads back from the directory of each of its members
+    if isinstance(security,Universe):
+        securities = [*security.securities,security]
+    else:
+        securities = [security]
+
+    for member in securities:
+        filepaths = partitions(member,report_type,start,end,rics)
+
+        parquet = [filepath for filepath in filepaths if filepath.endswith(".parquet")]
+        if parquet:
+            yield from read_parquet_partitions(parquet,report_type,columns,start,end,rics,chunksize)
+
+        for filepath in filepaths:
+            if not filepath.endswith(".parquet"):
+                yield from read_csv_partition(filepath,report_type,columns,start,end,rics,chunksize)
+
+def load(security,report_type,start,end=None,columns=None,rics=None,chunksize=None):
+    # with a chunksize, chunks are handed out as they are read; otherwise
+    # only the matching rows are kept and joined into one frame
+    if chunksize is not None:
+        return iter_chunks(security,report_type,start,end,columns,rics,chunksize)
+
+    chunks = list(iter_chunks(security,report_type,start,end,columns,rics))
+    if not chunks:
+        return pd.DataFrame(columns=columns)
+
+    frame = pd.concat(chunks,ignore_index=True)
+
+    # chunks with different categories are joined as plain strings
+    schema = SCHEMAS.get(report_type,{})
+    for column in frame.columns:
+        if schema.get(column) == "category":
+            frame[column] = frame[column].astype("category")
+
+    return frame
+
+## MAIN #######################################################################
+
+if __name__ == "__main__":
+    ## one hour of quotes for a single contract
+    quotes = load(
+        Futures("ES","US/Central"),
+        "Quotes",
+        "2024-01-02 09:00",
+        "2024-01-02 10:00",
+        columns = ["#RIC","Date-Time","Bid Price","Ask Price"],
+        rics = ["ESH4"]
+    )
@@ -1,8 +1,32 @@
 import requests,json
+import re
+import urllib3
 import os
+import copy
+import sqlite3
+import contextlib
+import threading
+import concurrent.futures
+import collections
+import io
+
+from time import time,sleep
 
 import hashlib
+import gzip
+import csv
 import pandas as pd
+import numpy as np
+import metrics
+
+from pandas.tseries import holiday
+
+# file locks are flock on posix and a locked first byte on windows
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
 
 ## DEFINE GLOBAL VARIABLES ####################################################
 
@@ -16,24 +40,184 @@ PROXY = {
     "https": ""
 }
 
+# the chain cache, catalog and other state files are kept in DATA_DIR,
+# wherever it points when they are used
 DATA_DIR = "data"
 
+# daily files are written as "csv" (gzipped) or "parquet"
+OUTPUT_FORMAT = "csv"
+PARQUET_ROW_GROUP = 100000
+
+# daily csv files are compressed with "gzip", "zstd", "lz4" or "none" (for
+# staging), at the codec's default level unless one is given; blocks of
+# each file are compressed in parallel on a few threads
+COMPRESSION = "gzip"
+COMPRESSION_LEVEL = None
+COMPRESSION_THREADS = 4
+COMPRESSION_BLOCK = 1 << 20
+
+# daily files held open at once while splitting a bulk file, e.g. of a wide
+# universe; the least recently written is closed, and reopened when needed
+MAX_OPEN_FILES = 256
+
+# keep-alive connections held open per session, and (connect, read) timeouts
+POOL_SIZE = 8
+TIMEOUT = (10,180)
+
+# every process shares a budget of API calls per interval (in seconds), and
+# backs off for a while when the API reports too many calls
+RATE_LIMIT_FILE = os.path.join(os.path.expanduser("~"),".refinitiv_ratelimit.json")
+API_CALL_LIMIT = 200
+API_CALL_INTERVAL = 60
+THROTTLE_PAUSE = 10
+MAX_THROTTLES = 5
+
+# outstanding jobs are polled between these intervals (in seconds)
+POLL_MIN_INTERVAL = 1
+POLL_MAX_INTERVAL = 60
+POLL_MAX_ERRORS = 5
+
+# tokens are shared by every process through an on-disk cache, and refreshed
+# an hour before they expire after 24 hours
+TOKEN_CACHE = os.path.join(os.path.expanduser("~"),".refinitiv_tokens.json")
+TOKEN_LIFETIME = 24 * 3600
+TOKEN_MARGIN = 3600
+
+# identifiers packed into a single batched extraction
+MAX_IDENTIFIERS = 1000
+
+# resolved chain constituents never change, so they are kept on disk
+CHAIN_CACHE = "chains.sqlite"
+
+# a day which came back empty is asked for again until it was checked this
+# many days after it, in case the vendor had not published it yet
+EMPTY_RECHECK_DAYS = 7
+
+# every daily file written is indexed here, with statistics of its rows
+CATALOG_FILE = "catalog.sqlite"
+
+# reports are streamed to disk in chunks, resuming a dropped download a few times
+CHUNK_SIZE = 1 << 20
+MAX_RESUMES = 5
+
+## FILE LOCKS #################################################################
+
+def lock_file(f):
+    # an exclusive lock over processes, released when the file is closed
+    if fcntl is not None:
+        fcntl.flock(f,fcntl.LOCK_EX)
+    else:
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(),msvcrt.LK_LOCK,1)
+                return
+            except OSError:
+                # LK_LOCK gives up after ten seconds
+                continue
+
 ## SESSION CLASS ##############################################################
 
 class Session:
     token = ""
+    issued = 0
+    poller = None
 
-    def __init__(self,username,password):
+    def __init__(self,username,password,pool_size=POOL_SIZE,timeout=TIMEOUT):
         self.username = username
         self.password = password
 
-        # generate a token upon initialization
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.open_transport()
+        self.limiter = RateLimiter()
+
+        # reuse a cached token, or generate one upon initialization
         self.authenticate()
 
-    def authenticate(self):
+    def open_transport(self):
+        # every call made through this session shares one keep-alive pool
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections = self.pool_size,
+            pool_maxsize = self.pool_size
+        )
+
+        self.transport = requests.Session()
+        self.transport.mount("https://",adapter)
+        self.transport.mount("http://",adapter)
+
+        if self.token:
+            self.transport.headers["Authorization"] = "Token %s" % (self.token)
+
+    def request(self,method,endpoint,**kwargs):
+        kwargs.setdefault("timeout",self.timeout)
+
+        # refresh once ahead of expiry rather than waiting for a rejection
+        if time() - self.issued > TOKEN_LIFETIME - TOKEN_MARGIN:
+            self.authenticate(self.token)
+
+        token = self.token
+        json_response = self.send(method,endpoint,**kwargs)
+
+        if json_response.status_code == 401:
+            # the token was revoked or expired early, so retry with a new one
+            self.authenticate(token)
+            json_response = self.send(method,endpoint,**kwargs)
+
+        return json_response
+
+    def send(self,method,endpoint,**kwargs):
+        # proxies are passed with each call, so they take precedence over any
+        # proxies set in the environment, as they did before sessions
+        kwargs.setdefault("proxies",PROXY)
+
+        # every call takes a slot from the limiter shared by all processes
+        for _ in range(MAX_THROTTLES + 1):
+            self.limiter.acquire()
+            json_response = self.transport.request(method,BASE_URL + endpoint,**kwargs)
+
+            if not is_throttled(json_response,kwargs.get("stream",False)):
+                break
+
+            # slow every process down, then try again
+            self.limiter.throttle(json_response.headers.get("Retry-After"))
+
+        return json_response
+
+    def get(self,endpoint,**kwargs):
+        return self.request("GET",endpoint,**kwargs)
+
+    def post(self,endpoint,**kwargs):
+        return self.request("POST",endpoint,**kwargs)
+
+    def set_token(self,token,issued):
+        self.token = token
+        self.issued = issued
+        self.transport.headers["Authorization"] = "Token %s" % (self.token)
+
+    def authenticate(self,stale_token=None):
+        # only one process at a time may refresh, the rest pick up its token
+        with open(TOKEN_CACHE + ".lock","a") as lock:
+            lock_file(lock)
+
+            tokens = read_token_cache()
+            cached = tokens.get(self.username)
+            if cached is not None:
+                fresh = time() - cached["issued"] < TOKEN_LIFETIME - TOKEN_MARGIN
+                if fresh and cached["token"] != stale_token:
+                    self.set_token(cached["token"],cached["issued"])
+                    return
+
+            self.set_token(self.request_token(),time())
+            tokens[self.username] = {"token": self.token,"issued": self.issued}
+            write_token_cache(tokens)
+
+    def request_token(self):
         headers = {
             "Prefer": "respond-async",
-            "Content-Type": "application/json; odata=minimalmetadata"
+            "Content-Type": "application/json; odata=minimalmetadata",
+            # a stale token should never be sent along with the credentials
+            "Authorization": None
         }
 
         data = {
@@ -43,30 +227,30 @@ class Session:
             }
         }
 
-        json_response = requests.post(
-            BASE_URL + "Authentication/RequestToken",
-            data = json.dumps(data),
-            headers = headers,
-            proxies = PROXY
-        )
+        with metrics.timer("auth_seconds"):
+            json_response = self.send(
+                "POST",
+                "Authentication/RequestToken",
+                data = json.dumps(data),
+                headers = headers,
+                timeout = self.timeout
+            )
 
         response = json.loads(json_response.text)
 
         try:
-            self.token = response["value"]
+            return response["value"]
         except:
             message = "Authentication Error: " + json.dumps(response,indent=4)
             raise Exception(message)
         
     def check_authorization(self):
         headers = {
-            "Authorization": "Token %s" % (self.token),
             "Prefer": "respond-async",
         }
-        json_response = requests.get(
-            BASE_URL + "Users/Users(%s)" % (self.username),
-            headers = headers,
-            proxies = PROXY
+        json_response = self.get(
+            "Users/Users(%s)" % (self.username),
+            headers = headers
         )
 
         response = json.loads(json_response.text)
@@ -74,56 +258,255 @@ class Session:
 
     def check_usage(self):
         headers = {
-            "Authorization": "Token %s" % (self.token),
             "Prefer": "respond-async",
         }
 
-        json_response = requests.get(
-            BASE_URL + "Quota/GetQuotaInformation",
-            headers = headers,
-            proxies = PROXY
+        json_response = self.get(
+            "Quota/GetQuotaInformation",
+            headers = headers
         )
 
         response = json.loads(json_response.text)
         return response
     
-    def check_status_async(self,job_id):        
+    def check_status_async(self,job_id,wait=120):
         request_header = {
-            "Authorization": "Token %s" % (self.token),
             "Content-Type": "application/json",
             "Accept-Charset": "UTF-8",
-            "Prefer": "respond-async, wait=120",
+            "Prefer": "respond-async, wait=%d" % (wait),
         }
 
         # wait for the request to return a status code 200
-        json_response = requests.get(
-            BASE_URL + "Extractions/ExtractRawResult(ExtractionId='%s')" % (job_id),
-            headers = request_header,
-            proxies = PROXY
+        json_response = self.get(
+            "Extractions/ExtractRawResult(ExtractionId='%s')" % (job_id),
+            headers = request_header
         )
 
         return json_response
     
-    def check_status(self,job_id,timeout):
-        # get requests timeout in 30s intervals
-        max_counter = timeout // 30
-        counter = 0
+    def check_status(self,job_id,timeout,report_type=""):
+        # the shared poller checks on this job alongside every other one
+        future = self.get_poller().track(job_id,report_type)
 
-        status_code = 202
-        json_response = None
-        
-        # if requests timeout according to our criteria, the API returns a 202
-        while (status_code == 202):
-            json_response = self.check_status_async(job_id)
-            status_code = json_response.status_code
-            
-            if (counter >= max_counter):
-                print("Exceeded maximum status checks")
-                return 202
-            
-            counter += 1
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            self.get_poller().untrack(job_id)
+            print("Exceeded maximum status checks")
+            return 202
+
+    def get_poller(self):
+        if self.poller is None:
+            self.poller = StatusPoller(self)
+        return self.poller
+
+    def __getstate__(self):
+        # the poller thread stays with the process that started it
+        state = self.__dict__.copy()
+        state["poller"] = None
+        return state
+
+## RATE LIMITER ###############################################################
+
+def is_throttled(json_response,stream=False):
+    if json_response.status_code == 429:
+        return True
+    elif json_response.status_code < 400 or stream:
+        return False
+
+    # some rejections only say so in the message
+    return "too many" in json_response.text.lower()
+
+class RateLimiter:
+    # a token bucket kept in a locked file, so every process on the machine
+    # draws from the same budget of API calls
+    def __init__(self,path=None,calls=None,interval=None):
+        # module settings are read when the limiter is made, so they can be
+        # pointed elsewhere, e.g. at a local mock server with its own budget
+        self.path = RATE_LIMIT_FILE if path is None else path
+        self.calls = API_CALL_LIMIT if calls is None else calls
+        self.interval = API_CALL_INTERVAL if interval is None else interval
+
+    @contextlib.contextmanager
+    def state(self):
+        with open(self.path,"a+") as f:
+            lock_file(f)
+            f.seek(0)
 
-        return json_response
+            try:
+                state = json.loads(f.read())
+            except ValueError:
+                state = {}
+
+            now = time()
+            ceiling = self.calls / self.interval
+            state.setdefault("rate",ceiling)
+            state.setdefault("tokens",float(self.calls))
+            state.setdefault("updated",now)
+            state.setdefault("paused_until",0)
+
+            # refill the bucket and win back throttled rate over one interval,
+            # but nothing accrues while every process is paused
+            elapsed = max(now - max(state["updated"],state["paused_until"]),0)
+            state["rate"] = min(state["rate"] + ceiling * elapsed / self.interval,ceiling)
+            state["tokens"] = min(state["tokens"] + state["rate"] * elapsed,self.calls)
+            state["updated"] = now
+
+            yield state
+
+            f.seek(0)
+            f.truncate()
+            f.write(json.dumps(state))
+
+    def acquire(self):
+        while True:
+            with self.state() as state:
+                now = time()
+                if state["paused_until"] > now:
+                    delay = state["paused_until"] - now
+                elif state["tokens"] >= 1:
+                    state["tokens"] -= 1
+                    return
+                else:
+                    delay = (1 - state["tokens"]) / state["rate"]
+
+            sleep(delay)
+
+    def throttle(self,retry_after=None):
+        with self.state() as state:
+            # halve the pace and drain the bucket, honoring any requested pause
+            state["rate"] = max(state["rate"] / 2,self.calls / self.interval / 20)
+            state["tokens"] = 0
+
+            try:
+                pause = float(retry_after)
+            except (TypeError,ValueError):
+                pause = THROTTLE_PAUSE
+            state["paused_until"] = max(state["paused_until"],time() + pause)
+
+## STATUS POLLER ##############################################################
+
+class StatusPoller:
+    def __init__(self,session,min_interval=POLL_MIN_INTERVAL,max_interval=POLL_MAX_INTERVAL):
+        self.session = session
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+
+        # outstanding jobs by id, and typical completion times by report type
+        self.jobs = {}
+        self.durations = {}
+
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def track(self,job_id,report_type=""):
+        now = time()
+        job = {
+            "future": concurrent.futures.Future(),
+            "report_type": report_type,
+            "submitted": now,
+            "interval": self.min_interval,
+            "errors": 0
+        }
+        job["next_poll"] = now + self.first_interval(report_type)
+
+        with self.condition:
+            self.jobs[job_id] = job
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run,daemon=True)
+                self.thread.start()
+
+            self.condition.notify()
+
+        return job["future"]
+
+    def untrack(self,job_id):
+        with self.condition:
+            self.jobs.pop(job_id,None)
+
+    def first_interval(self,report_type):
+        # look in just before jobs of this type have usually finished
+        expected = self.durations.get(report_type)
+        if expected is None:
+            return self.min_interval
+        return min(max(0.8 * expected,self.min_interval),self.max_interval)
+
+    def next_interval(self,job):
+        # back off geometrically, but never sleep through the expected finish
+        job["interval"] = min(2 * job["interval"],self.max_interval)
+        expected = self.durations.get(job["report_type"])
+        if expected is not None:
+            remaining = expected - (time() - job["submitted"])
+            if remaining > self.min_interval:
+                return min(job["interval"],remaining)
+
+        return job["interval"]
+
+    def record(self,job):
+        # exponentially weighted completion time per report type
+        elapsed = time() - job["submitted"]
+        expected = self.durations.get(job["report_type"])
+        if expected is None:
+            self.durations[job["report_type"]] = elapsed
+        else:
+            self.durations[job["report_type"]] = 0.8 * expected + 0.2 * elapsed
+
+    def run(self):
+        while True:
+            with self.condition:
+                if not self.jobs:
+                    self.thread = None
+                    return
+
+                # sleep until the next job is due, or a new job arrives
+                job_id = min(self.jobs,key=lambda i: self.jobs[i]["next_poll"])
+                delay = self.jobs[job_id]["next_poll"] - time()
+                if delay > 0:
+                    self.condition.wait(delay)
+                    continue
+
+                job = self.jobs[job_id]
+
+            self.poll(job_id,job)
+
+    def poll(self,job_id,job):
+        try:
+            json_response = self.session.check_status_async(job_id,wait=1)
+        except Exception as e:
+            job["errors"] += 1
+            if job["errors"] >= POLL_MAX_ERRORS:
+                self.untrack(job_id)
+                self.settle(job,exception=e)
+            else:
+                job["next_poll"] = time() + self.next_interval(job)
+            return
+
+        if json_response.status_code in (202,429):
+            # the job is still running, or we are asked to slow down
+            retry_after = json_response.headers.get("Retry-After")
+            try:
+                delay = float(retry_after)
+            except (TypeError,ValueError):
+                delay = self.next_interval(job)
+
+            job["next_poll"] = time() + delay
+            return
+
+        if json_response.status_code == 200:
+            self.record(job)
+
+        self.untrack(job_id)
+        self.settle(job,result=json_response)
+
+    def settle(self,job,result=None,exception=None):
+        # a waiter may have given up on the job in the meantime
+        try:
+            if exception is not None:
+                job["future"].set_exception(exception)
+            else:
+                job["future"].set_result(result)
+        except concurrent.futures.InvalidStateError:
+            pass
 
 ## EXTRACTION CLASS ###########################################################
 
@@ -131,11 +514,15 @@ class Extraction:
     job_id = None
     odata_type = "#DataScope.Select.Api.Extractions.ExtractionRequests."
     report_type = ""
+    date_col = "Date-Time"
+    ric_col = "#RIC"
+
+    # rows are stamped in utc, but requests and daily files run over the
+    # local days of the venue
+    utc_dates = True
 
     def __init__(self,session,security):
-        session.check_authorization()
         self.session  = session
-        self.token    = session.token
         self.security = security
 
         self.condition = {
@@ -146,29 +533,30 @@ class Extraction:
 
         self.identifiers = {
             "@odata.type": self.odata_type + "InstrumentIdentifierList",
-            "InstrumentIdentifiers": [
-                {
-                    "Identifier": self.security.chain_rics,
-                    "IdentifierType": self.security.ric_type,
-                }
-            ],
+            "InstrumentIdentifiers": self.security.instrument_identifiers(),
             "ValidationOptions": None,
             "UseUserPreferencesForValidationOptions": "false"
         }
 
+    def clone(self):
+        # requests write their dates and job id onto the extraction, so jobs
+        # that run concurrently each need their own copy of that state
+        twin = copy.copy(self)
+        twin.condition = copy.deepcopy(self.condition)
+        twin.identifiers = copy.deepcopy(self.identifiers)
+        return twin
+
     def get_valid_content(self,provider):
         headers = {
-            "Authorization": "Token %s" % (self.token),
             "Content-Type": "application/json",
             "Accept-Charset": "UTF-8",
             "Prefer": "respond-async, wait=1",
         }
 
         request_type  = "DataScope.Select.Api.Extractions.ReportTemplates.ReportTemplateTypes'%s'" % (provider)
-        json_response = requests.get(
-            BASE_URL + "Extractions/GetValidContentFieldTypes(ReportTemplateType=%s)" % (request_type),
-            headers = headers,
-            proxies = PROXY
+        json_response = self.session.get(
+            "Extractions/GetValidContentFieldTypes(ReportTemplateType=%s)" % (request_type),
+            headers = headers
         )
 
         fieldnames = {}
@@ -184,9 +572,10 @@ class Extraction:
         end_date = start_date if end_date is None else end_date
         timezone = self.security.timezone
 
-        # query based on calendar date, not trading date
-        local_start_date = start_date + "T00:00:00.000000"
-        local_end_date   = end_date + "T23:59:59.999999"
+        # query based on calendar date, trimmed to the venue's session hours
+        calendar = self.security.calendar()
+        local_start_date = calendar.session_window(start_date)[0]
+        local_end_date   = calendar.session_window(end_date)[1]
         
         utc_start_date = convert_to_utc(local_start_date,timezone)
         utc_end_date   = convert_to_utc(local_end_date,timezone)
@@ -201,7 +590,6 @@ class Extraction:
             "Content-Type": "application/json",
             "Prefer": "respond-async, wait=1",
             "Accept-Encoding": "gzip",
-            "Authorization": "Token %s" % (self.token),
         }
 
         data = {
@@ -213,11 +601,10 @@ class Extraction:
             }
         }
 
-        json_response = requests.post(
-                BASE_URL + "Extractions/ExtractRaw",
+        json_response = self.session.post(
+                "Extractions/ExtractRaw",
                 headers = headers,
-                data = json.dumps(data,sort_keys=True),
-                proxies = PROXY
+                data = json.dumps(data,sort_keys=True)
             )
 
         try:
@@ -232,8 +619,9 @@ class Extraction:
         
         return self.job_id
     
-    def get_output_filepath(self):
-        directory = os.path.join(DATA_DIR,self.security.base_ric,self.report_type)
+    def get_output_filepath(self,security=None):
+        security = self.security if security is None else security
+        directory = data_path(security.base_ric,self.report_type)
         if not os.path.exists(directory):
             os.makedirs(directory)
 
@@ -245,25 +633,63 @@ class Extraction:
             "Prefer": "respond-async, wait=1",
             "Accept-Encoding": "gzip",
             "X-Direct-Download": "true",
-            "Authorization": "Token %s" % (self.token),
         }
 
-        try:
-            # download directly from AWS
-            json_response = requests.get(
-                BASE_URL + "Extractions/RawExtractionResults('%s')/$value" % (self.job_id),
-                headers = headers,
-                proxies = PROXY,
-                stream = True
-            )
-
-            json_response.decode_content = False
-            filepath = os.path.join(self.get_output_filepath(),filename)
-            with open(filepath,"wb") as f:
-                f.write(json_response.raw.read())
+        filepath = os.path.join(self.get_output_filepath(),filename)
+        partial_path = filepath + ".part"
+
+        total_bytes = 0
+        resumes = 0
+        timer = time()
+
+        # write fixed size chunks to a partial file, renamed once complete
+        with open(partial_path,"wb") as f:
+            while True:
+                if total_bytes > 0:
+                    headers["Range"] = "bytes=%d-" % (total_bytes)
+
+                try:
+                    # download directly from AWS
+                    json_response = self.session.get(
+                        "Extractions/RawExtractionResults('%s')/$value" % (self.job_id),
+                        headers = headers,
+                        stream = True
+                    )
+                    json_response.raise_for_status()
+
+                    if total_bytes > 0 and json_response.status_code != 206:
+                        # the range was ignored, so start from the beginning
+                        f.seek(0)
+                        f.truncate()
+                        total_bytes = 0
+
+                    # keep the file gzipped exactly as it was served
+                    for chunk in json_response.raw.stream(CHUNK_SIZE,decode_content=False):
+                        f.write(chunk)
+                        total_bytes += len(chunk)
+
+                    break
+                except requests.HTTPError:
+                    os.remove(partial_path)
+                    raise
+                except (requests.RequestException,urllib3.exceptions.HTTPError):
+                    # resume from the last byte written after a dropped connection
+                    resumes += 1
+                    if resumes > MAX_RESUMES:
+                        os.remove(partial_path)
+                        raise
+
+        os.replace(partial_path,filepath)
+
+        elapsed_time = max(time() - timer,1e-6)
+        self.download_stats = {
+            "bytes": total_bytes,
+            "seconds": elapsed_time,
+            "bytes_per_sec": total_bytes / elapsed_time,
+            "resumes": resumes
+        }
 
-        except Exception as e:
-            raise e
+        return self.download_stats
         
     def split_files(self,filename):
         start_date = filename[0:10]
@@ -272,38 +698,406 @@ class Extraction:
         output_dir = self.get_output_filepath()
         old_filepath = os.path.join(output_dir,filename)
 
-        # if the file is empty, just delete it
+        # if the file is empty, just delete it and note that nothing came back
         if os.stat(old_filepath).st_size == 0:
             os.remove(old_filepath)
+            self.finalize_empty(start_date,end_date)
+            return {}
+
+        if isinstance(self.security,Universe):
+            return self.demux_files(filename)
 
-        if end_date == start_date:
-            # rename files which only download a single date
-            new_filename = "%s.csv.gz" % (start_date)
+        if end_date == start_date and COMPRESSION == "gzip":
+            # a single date is kept exactly as the server compressed it
             os.rename(
                 old_filepath,
-                os.path.join(output_dir,new_filename)
+                os.path.join(output_dir,csv_filename(start_date))
             )
+            row_counts = {start_date: None}
+            stats = {}
         else:
-            # break up bulk data into daily files
-            bulk_data = pd.read_csv(old_filepath)
-            dates = pd.date_range(start_date,end_date).strftime("%Y-%m-%d").to_list()
-            
-            # EndOfDay data is treated differently
-            date_col = "Trade Date" if self.report_type == "EndOfDay" else "Date-Time"
-            filedates = pd.to_datetime(bulk_data[date_col])
-
-            for date in dates:
-                daily_data = bulk_data.loc[filedates == date]
-                new_filename = "%s.csv.gz" % (date)
-                daily_data.to_csv(
-                    os.path.join(output_dir,new_filename),
-                    compression = "gzip",
-                    index = False
-                )
+            # break up bulk data into daily files, one row at a time; days
+            # outside the chunk belong to other chunks and are never opened
+            def filepath_for(date):
+                if start_date <= date <= end_date:
+                    return os.path.join(output_dir,csv_filename(date))
+
+            dates = self.request_dates(start_date,end_date)
+            filepaths = {date: filepath_for(date) for date in dates}
+            stats = {}
+            row_counts = split_by_date(
+                old_filepath,
+                self.date_col,
+                filepaths,
+                self.ric_col,
+                stats = stats,
+                filepath_for = filepath_for,
+                timezone = self.split_timezone()
+            )
 
             # once daily files are saved, delete the old file
             os.remove(old_filepath)
+
+        self.finalize(row_counts,stats=stats)
+        return row_counts
+
+    def demux_files(self,filename):
+        start_date = filename[0:10]
+        end_date   = filename[11:21]
+
+        old_filepath = os.path.join(self.get_output_filepath(),filename)
+        dates = self.request_dates(start_date,end_date)
+
+        # send each row to the daily file of the security which owns its RIC,
+        # anything unclaimed stays with the universe itself
+        owners = self.security.owners(self.session,start_date,end_date)
+        filepaths = {}
+        output_dirs = {}
+        for security in [*self.security.securities,self.security]:
+            key = None if security is self.security else security.base_ric
+            output_dirs[key] = self.get_output_filepath(security)
+            for date in dates:
+                filepaths[(key,date)] = os.path.join(output_dirs[key],csv_filename(date))
+
+        def filepath_for(key):
+            if start_date <= key[1] <= end_date:
+                filepaths[key] = os.path.join(output_dirs[key[0]],csv_filename(key[1]))
+                return filepaths[key]
+
+        stats = {}
+        row_counts = split_by_date(
+            old_filepath,
+            self.date_col,
+            filepaths,
+            self.ric_col,
+            owners,
+            stats,
+            filepath_for,
+            self.split_timezone()
+        )
+        os.remove(old_filepath)
+
+        # the universe only keeps days on which some row went unclaimed
+        member_counts = {}
+        member_stats = {}
+        for (key,date),count in row_counts.items():
+            if key is None and count == 0:
+                continue
+
+            base_ric = self.security.base_ric if key is None else key
+            member_counts.setdefault(base_ric,{})[date] = count
+            member_stats.setdefault(base_ric,{})[date] = stats[(key,date)]
+
+        members = {security.base_ric: security for security in [*self.security.securities,self.security]}
+        for base_ric,counts in member_counts.items():
+            self.finalize(counts,members[base_ric],member_stats[base_ric])
+
+        return member_counts
+
+    def finalize(self,row_counts,security=None,stats=None):
+        output_dir = self.get_output_filepath(security)
+        manifest = self.manifest(security)
+        catalog = Catalog()
+        base_ric = (self.security if security is None else security).base_ric
+
+        for date,rows in row_counts.items():
+            # files renamed straight from the server have not been read yet
+            ric_stats = None if stats is None else stats.get(date)
+            if ric_stats is None:
+                ric_stats = file_stats(os.path.join(output_dir,csv_filename(date)),self.date_col,self.ric_col)
+                rows = sum(stat[2] for stat in ric_stats.values())
+
+            # a day without rows may not have been published yet, so it is
+            # kept like an empty extraction and asked for again until settled
+            if rows == 0:
+                for filename in {csv_filename(date),daily_filename(date)}:
+                    if os.path.exists(os.path.join(output_dir,filename)):
+                        os.remove(os.path.join(output_dir,filename))
+
+                record = manifest.record(date,None,0)
+                catalog.record(base_ric,self.report_type,None,record)
+                continue
+
+            if OUTPUT_FORMAT == "parquet":
+                self.write_parquet(date,security)
+
+            # record each finished daily file so later runs can skip it, and
+            # index it so questions about it are answered without reading it
+            filepath = os.path.join(output_dir,daily_filename(date))
+            record = manifest.record(date,filepath,rows)
+            catalog.record(base_ric,self.report_type,filepath,record,ric_stats)
+
+    def finalize_empty(self,start_date,end_date):
+        if isinstance(self.security,Universe):
+            securities = self.security.securities
+        else:
+            securities = [self.security]
+
+        catalog = Catalog()
+        for security in securities:
+            manifest = self.manifest(security)
+            for date in self.request_dates(start_date,end_date):
+                record = manifest.record(date,None,0)
+                catalog.record(security.base_ric,self.report_type,None,record)
+
+    def split_timezone(self):
+        # rows go to the daily file of their local day, as they were requested
+        return self.security.timezone if self.utc_dates else None
+
+    def request_dates(self,start_date,end_date=None):
+        # calendar days on which the venue trades at some point
+        end_date = start_date if end_date is None else end_date
+        return self.security.calendar().active_days(start_date,end_date)
+
+    def manifest(self,security=None):
+        return Manifest(self.get_output_filepath(security))
+
+    def missing_dates(self,dates,checksum=False):
+        if isinstance(self.security,Universe):
+            securities = self.security.securities
+        else:
+            securities = [self.security]
+
+        # a date is only done once every security has a verified file for it
+        missing = set()
+        for security in securities:
+            missing.update(self.manifest(security).missing(dates,checksum))
+
+        return [date for date in dates if date in missing]
+
+    def write_parquet(self,date,security=None):
+        security = self.security if security is None else security
+        output_dir = self.get_output_filepath(security)
+        csv_filepath = os.path.join(output_dir,csv_filename(date))
+
+        with metrics.timer("compress_seconds",base_ric=security.base_ric,report_type=self.report_type):
+            write_parquet(
+                csv_filepath,
+                os.path.join(output_dir,"%s.parquet" % (date)),
+                self.date_col,
+                self.report_type
+            )
+
+        # the parquet file replaces the daily csv
+        os.remove(csv_filepath)
         
+## MANIFEST ###################################################################
+
+class Manifest:
+    def __init__(self,directory):
+        self.directory = directory
+        self.path = os.path.join(directory,"manifest.jsonl")
+
+    def load(self):
+        # later records for a date replace earlier ones
+        records = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    records[record["date"]] = record
+
+        return records
+
+    def record(self,date,filepath,rows=None):
+        if filepath is None:
+            # the extraction came back empty, so there is no file to keep
+            record = {"date": date,"file": None,"rows": 0,"bytes": 0,"md5": None,"checked": time()}
+        else:
+            # files renamed straight from the server have not been counted yet
+            if rows is None:
+                rows = count_lines(filepath) - 1
+
+            record = {
+                "date": date,
+                "file": os.path.basename(filepath),
+                "rows": rows,
+                "bytes": os.stat(filepath).st_size,
+                "md5": md5(filepath)
+            }
+
+        # single appended lines are not interleaved between processes
+        with open(self.path,"a") as f:
+            f.write(json.dumps(record) + "\n")
+
+        return record
+
+    def verify(self,record,checksum=False):
+        if record["file"] is None:
+            # an empty day is only settled once it was checked well after it
+            settled = pd.Timestamp(record["date"]) + pd.Timedelta(days=EMPTY_RECHECK_DAYS+1)
+            return record.get("checked",0) >= settled.timestamp()
+
+        filepath = os.path.join(self.directory,record["file"])
+        if not os.path.exists(filepath):
+            return False
+        elif os.stat(filepath).st_size != record["bytes"]:
+            return False
+        elif checksum:
+            return md5(filepath) == record["md5"]
+
+        return True
+
+    def missing(self,dates,checksum=False):
+        records = self.load()
+        return [
+            date for date in dates
+            if date not in records or not self.verify(records[date],checksum)
+        ]
+
+class Catalog:
+    # files are recorded relative to DATA_DIR, so the catalog still finds them
+    # from another working directory or after DATA_DIR is moved
+    def __init__(self,path=None):
+        self.path = data_path(CATALOG_FILE) if path is None else path
+
+    @contextlib.contextmanager
+    def connect(self):
+        os.makedirs(os.path.dirname(self.path) or ".",exist_ok=True)
+        connection = sqlite3.connect(self.path,timeout=60)
+        connection.row_factory = sqlite3.Row
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "base_ric TEXT, report_type TEXT, date TEXT, file TEXT, rows INTEGER, "
+            "bytes INTEGER, md5 TEXT, min_time TEXT, max_time TEXT, "
+            "schema_version INTEGER, written REAL, "
+            "PRIMARY KEY (base_ric,report_type,date))"
+        )
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS rics ("
+            "base_ric TEXT, report_type TEXT, date TEXT, ric TEXT, rows INTEGER, "
+            "min_time TEXT, max_time TEXT, "
+            "PRIMARY KEY (base_ric,report_type,date,ric))"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS rics_by_ric ON rics (ric,min_time)")
+
+        # commit on success, and always close the connection
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def record(self,base_ric,report_type,filepath,record,ric_stats=None):
+        # ric_stats holds [first timestamp, last timestamp, rows] of each RIC
+        ric_stats = {
+            ric: (catalog_time(first),catalog_time(last),rows)
+            for ric,(first,last,rows) in (ric_stats or {}).items()
+        }
+        min_time = min((stat[0] for stat in ric_stats.values()),default=None)
+        max_time = max((stat[1] for stat in ric_stats.values()),default=None)
+
+        key = (base_ric,report_type,record["date"])
+        with self.connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO files VALUES (?,?,?,?,?,?,?,?,?,?,?)",
+                (*key,relative_path(filepath),record["rows"],record["bytes"],record["md5"],
+                    min_time,max_time,SCHEMA_VERSION,time())
+            )
+            connection.execute("DELETE FROM rics WHERE base_ric = ? AND report_type = ? AND date = ?",key)
+            connection.executemany(
+                "INSERT INTO rics VALUES (?,?,?,?,?,?,?)",
+                [(*key,ric,rows,first,last) for ric,(first,last,rows) in ric_stats.items()]
+            )
+
+    def files(self,base_ric,report_type,start_date=None,end_date=None):
+        # the catalogued days of a security's report, including empty ones
+        with self.connect() as connection:
+            rows = connection.execute(
+                "SELECT * FROM files WHERE base_ric = ? AND report_type = ? "
+                "AND date >= ? AND date <= ? ORDER BY date",
+                (base_ric,report_type,start_date or "",end_date or "9999")
+            ).fetchall()
+
+        return {row["date"]: resolve_file(row) for row in rows}
+
+    def dates(self,base_ric,report_type,start_date=None,end_date=None):
+        files = self.files(base_ric,report_type,start_date,end_date)
+        return [date for date,record in files.items() if record["file"] is not None]
+
+    def matching(self,base_ric,report_type,start_time,end_time,rics=None):
+        # days with rows inside the time range, and of any of the RICs
+        start_time,end_time = catalog_time(start_time),catalog_time(end_time)
+        if rics is None:
+            query = (
+                "SELECT date FROM files WHERE base_ric = ? AND report_type = ? "
+                "AND max_time >= ? AND min_time <= ?"
+            )
+            parameters = (base_ric,report_type,start_time,end_time)
+        else:
+            rics = list(rics)
+            query = (
+                "SELECT DISTINCT date FROM rics WHERE base_ric = ? AND report_type = ? "
+                "AND max_time >= ? AND min_time <= ? AND ric IN (%s)" % (",".join("?" * len(rics)))
+            )
+            parameters = (base_ric,report_type,start_time,end_time,*rics)
+
+        with self.connect() as connection:
+            return {row["date"] for row in connection.execute(query,parameters)}
+
+    def first_timestamp(self,ric,report_type=None):
+        return self.ric_times(ric,report_type)[0]
+
+    def last_timestamp(self,ric,report_type=None):
+        return self.ric_times(ric,report_type)[1]
+
+    def ric_times(self,ric,report_type=None):
+        query = "SELECT MIN(min_time),MAX(max_time) FROM rics WHERE ric = ?"
+        parameters = (ric,)
+        if report_type is not None:
+            query += " AND report_type = ?"
+            parameters += (report_type,)
+
+        with self.connect() as connection:
+            first,last = connection.execute(query,parameters).fetchone()
+
+        return (
+            None if first is None else pd.Timestamp(first),
+            None if last is None else pd.Timestamp(last)
+        )
+
+    def summary(self,base_ric,report_type):
+        # days, rows and bytes of every daily file held
+        with self.connect() as connection:
+            days,rows,nbytes = connection.execute(
+                "SELECT COUNT(*),SUM(rows),SUM(bytes) FROM files "
+                "WHERE base_ric = ? AND report_type = ? AND file IS NOT NULL",
+                (base_ric,report_type)
+            ).fetchone()
+
+        return days,rows or 0,nbytes or 0
+
+    def verify(self,base_ric,report_type,checksum=False):
+        # days whose file has gone missing or no longer matches its record
+        failed = []
+        for date,record in self.files(base_ric,report_type).items():
+            filepath = record["file"]
+            if filepath is None:
+                continue
+            elif not os.path.exists(filepath) or os.stat(filepath).st_size != record["bytes"]:
+                failed.append(date)
+            elif checksum and md5(filepath) != record["md5"]:
+                failed.append(date)
+
+        return failed
+
+    def stale(self,base_ric=None,report_type=None):
+        # files written under older schemas, which may need converting again
+        query = "SELECT base_ric,report_type,date,file FROM files WHERE schema_version < ?"
+        parameters = (SCHEMA_VERSION,)
+        if base_ric is not None:
+            query += " AND base_ric = ?"
+            parameters += (base_ric,)
+        if report_type is not None:
+            query += " AND report_type = ?"
+            parameters += (report_type,)
+
+        with self.connect() as connection:
+            return [resolve_file(row) for row in connection.execute(query,parameters)]
+
 class HighFreq(Extraction):
     def __init__(self,session,security):
         Extraction.__init__(self,session,security)
@@ -314,7 +1108,7 @@ class HighFreq(Extraction):
 
     def request_trades(self,start_date,end_date=None,fieldnames=None):
         self.condition["ApplyCorrectionsAndCancellations"] = "true"
-        self.odata_type += "TickHistoryTimeAndSalesExtractionRequest"
+        self.odata_type = Extraction.odata_type + "TickHistoryTimeAndSalesExtractionRequest"
         if fieldnames is None:
             fieldnames = [
                 "Trade - Price",
@@ -328,7 +1122,7 @@ class HighFreq(Extraction):
     
     def request_quotes(self,start_date,end_date=None,fieldnames=None):
         self.condition["ApplyCorrectionsAndCancellations"] = "true"
-        self.odata_type += "TickHistoryTimeAndSalesExtractionRequest"
+        self.odata_type = Extraction.odata_type + "TickHistoryTimeAndSalesExtractionRequest"
         if fieldnames is None:
             fieldnames = [
                 "Quote - Bid Price",
@@ -346,7 +1140,7 @@ class HighFreq(Extraction):
         self.condition["View"] = "NormalizedLL2"
         self.condition["NumberOfLevels"] = 10
 
-        self.odata_type += "TickHistoryMarketDepthExtractionRequest"
+        self.odata_type = Extraction.odata_type + "TickHistoryMarketDepthExtractionRequest"
         if fieldnames is None:
             fieldnames = [
                 "Ask Price",
@@ -424,7 +1218,7 @@ class IntraDay(Extraction):
         self.condition["DisplaySourceRIC"] = "true"
 
     def request(self,start_date,end_date=None,fieldnames=None):
-        self.odata_type += "TickHistoryIntradaySummariesExtractionRequest"
+        self.odata_type = Extraction.odata_type + "TickHistoryIntradaySummariesExtractionRequest"
         if fieldnames is None:
             fieldnames = [
                 "High Ask",
@@ -438,8 +1232,12 @@ class IntraDay(Extraction):
                 "Volume"
             ]
         
-        # change instrument values
+        # change instrument values; every constituent counts against the
+        # limit of one extraction, not just the securities asked for
         chain_res = self.security.historical_chain_resolution(self.session,start_date,end_date)
+        if len(chain_res) > MAX_IDENTIFIERS:
+            raise Exception("%s resolves to %d instruments, at most %d fit one extraction" % (
+                self.security.base_ric,len(chain_res),MAX_IDENTIFIERS))
         self.identifiers["InstrumentIdentifiers"] = chain_res
 
         return Extraction.request(self,start_date,end_date,fieldnames)
@@ -452,6 +1250,9 @@ class EndOfDay(Extraction):
     def __init__(self,session,security):
         Extraction.__init__(self,session,security)
         self.report_type = "EndOfDay"
+        self.date_col = "Trade Date"
+        self.ric_col = "RIC"
+        self.utc_dates = False
 
         # change instrument validation
         self.identifiers["ValidationOptions"] = {
@@ -464,7 +1265,7 @@ class EndOfDay(Extraction):
         }
 
     def request(self,start_date,end_date=None,fieldnames=None):
-        self.odata_type += "ElektronTimeseriesExtractionRequest"
+        self.odata_type = Extraction.odata_type + "ElektronTimeseriesExtractionRequest"
         if fieldnames is None:
             fieldnames = [
                 "Trade Date",
@@ -492,6 +1293,11 @@ class EndOfDay(Extraction):
             fieldnames
         )
     
+    def request_dates(self,start_date,end_date=None):
+        # end of day data only exists for trade dates
+        end_date = start_date if end_date is None else end_date
+        return self.security.calendar().trading_days(start_date,end_date)
+
     def get_valid_content(self):
         return Extraction.get_valid_content(self,"ElektronTimeseries")
 
@@ -499,7 +1305,6 @@ class EndOfDay(Extraction):
 
 def historical_search(session,ric,start_date,end_date):
     headers = {
-        "Authorization": "Token %s" % (session.token),
         "Prefer": "respond-async",
         "Content-Type": "application/json; odata=minimalmetadata"
     }
@@ -521,11 +1326,10 @@ def historical_search(session,ric,start_date,end_date):
         }
     }
     
-    json_response = requests.post(
-        BASE_URL + "/Search/HistoricalSearch",
+    json_response = session.post(
+        "Search/HistoricalSearch",
         headers = headers,
-        data = json.dumps(data),
-        proxies = PROXY
+        data = json.dumps(data)
     )
 
     response = json.loads(json_response.text)
@@ -534,7 +1338,6 @@ def historical_search(session,ric,start_date,end_date):
 # instrument search is relatively odd, not really sure how it's useful
 def instrument_search(session,ric):
     headers = {
-        "Authorization": "Token %s" % (session.token),
         "Prefer": "respond-async",
         "Content-Type": "application/json; odata=minimalmetadata"
     }
@@ -558,11 +1361,10 @@ def instrument_search(session,ric):
         }
     }
 
-    json_response = requests.post(
-        BASE_URL + "/Search/InstrumentSearch",
+    json_response = session.post(
+        "Search/InstrumentSearch",
         headers = headers,
-        data = json.dumps(data),
-        proxies = PROXY
+        data = json.dumps(data)
     )
 
     response = json.loads(json_response.text)
@@ -572,27 +1374,90 @@ class Security:
     chain_rics = ""
     ric_type = "Ric"
     timezone = None
+    venue = None
 
     def __init__(self,base_ric):
         self.base_ric = base_ric
+
+    def calendar(self):
+        # an explicit venue wins, otherwise guess it from the asset class
+        venue = self.venue
+        if venue is None:
+            venue = DEFAULT_VENUES.get((type(self).__name__,self.timezone))
+
+        return CALENDARS.get(venue,Calendar())
+
+    def instrument_identifiers(self):
+        return [{"Identifier": self.chain_rics,"IdentifierType": self.ric_type}]
+
+    def is_chain(self):
+        return self.ric_type == "ChainRIC" or self.chain_rics.startswith("0#")
     
     def historical_chain_resolution(self,session,start_date,end_date=None):
         end_date = start_date if end_date is None else end_date
+        dates = pd.date_range(start_date,end_date).strftime("%Y-%m-%d").to_list()
+
+        # utc window of each calendar day in local time
+        windows = [
+            (
+                convert_to_utc(date + "T00:00:00.000000",self.timezone),
+                convert_to_utc(date + "T23:59:59.999999",self.timezone)
+            )
+            for date in dates
+        ]
+
+        utc_start_date = windows[0][0]
+        utc_end_date   = windows[-1][1]
+
+        with chain_cache() as cache:
+            # every cached resolution inside the window belongs to the answer
+            cached = cache.execute(
+                "SELECT utc_start,utc_end,constituents FROM chains "
+                "WHERE chain_ric = ? AND utc_start >= ? AND utc_end <= ?",
+                (self.chain_rics,utc_start_date,utc_end_date)
+            ).fetchall()
+
+        # only ask the API for runs of consecutive days nobody has covered
+        missing = []
+        for i,(day_start,day_end) in enumerate(windows):
+            if any(start <= day_start and end >= day_end for start,end,_ in cached):
+                continue
+            elif missing and missing[-1][1] == i-1:
+                missing[-1][1] = i
+            else:
+                missing.append([i,i])
+
+        # the cache is closed while the API is called, so other workers are
+        # never held up by the round trips
+        resolved = []
+        for first,last in missing:
+            range_start = windows[first][0]
+            range_end   = windows[last][1]
+
+            constituents = self.request_chain_resolution(session,range_start,range_end)
+            resolved.append((self.chain_rics,range_start,range_end,json.dumps(constituents)))
+
+        if resolved:
+            with chain_cache() as cache:
+                cache.executemany("INSERT OR REPLACE INTO chains VALUES (?,?,?,?)",resolved)
+            cached.extend(row[1:] for row in resolved)
+
+        identifier_list = []
+        for _,_,constituents in cached:
+            for identifier in json.loads(constituents):
+                item = {"Identifier": identifier,"IdentifierType": "Ric"}
+                if item not in identifier_list:
+                    identifier_list.append(item)
+
+        return identifier_list
 
+    def request_chain_resolution(self,session,utc_start_date,utc_end_date):
         headers = {
-            "Authorization": "Token %s" % (session.token),
             "Content-Type": "application/json",
             "Accept-Charset": "UTF-8",
             "Prefer": "respond-async, wait=1",
         }
 
-        # Set the start and end date
-        local_start_date = start_date + "T00:00:00.000000" 
-        local_end_date   = end_date + "T23:59:59.999999"
-
-        utc_start_date = convert_to_utc(local_start_date,self.timezone)
-        utc_end_date   = convert_to_utc(local_end_date,self.timezone)
-
         data = {
             "Request": {
                 "ChainRics": [self.chain_rics, ],
@@ -603,23 +1468,23 @@ class Security:
             }
         }
 
-        json_response = requests.post(
-            BASE_URL + "/Search/HistoricalChainResolution",
-            headers = headers,
-            data = json.dumps(data),
-            proxies = PROXY
-        )
+        with metrics.timer("chain_resolution_seconds",chain_ric=self.chain_rics):
+            json_response = session.post(
+                "Search/HistoricalChainResolution",
+                headers = headers,
+                data = json.dumps(data)
+            )
         
         response = json.loads(json_response.text)
-        identifier_list = []
-        for item in response["value"][0]["Constituents"]:
-            identifier_list.append({"Identifier": item["Identifier"],"IdentifierType": "Ric"})
+        if len(response["value"]) == 0:
+            return []
 
-        return identifier_list
+        return [item["Identifier"] for item in response["value"][0]["Constituents"]]
     
 class Futures(Security):
-    def __init__(self,base_ric,timezone):
+    def __init__(self,base_ric,timezone,venue=None):
         Security.__init__(self,base_ric)
+        self.venue = venue
 
         if base_ric != "VX:VE":
             self.chain_rics = "0#" + base_ric + ":"
@@ -630,37 +1495,529 @@ class Futures(Security):
         self.timezone = timezone
 
 class Equity(Security):
-    def __init__(self,base_ric,timezone):
+    def __init__(self,base_ric,timezone,venue=None):
         Security.__init__(self,base_ric)
+        self.venue = venue
 
         self.chain_rics = base_ric
         self.timezone = timezone
 
 class Options(Security):
-    def __init__(self,base_ric,timezone):
+    def __init__(self,base_ric,timezone,venue=None):
         Security.__init__(self,base_ric)
+        self.venue = venue
 
         self.chain_rics = "0#" + base_ric + "*.U"
         self.timezone = timezone
 
 class Treasury(Security):
-    def __init__(self,base_ric,timezone):
+    def __init__(self,base_ric,timezone,venue=None):
         Security.__init__(self,base_ric)
+        self.venue = venue
 
         self.chain_rics = "0#" + base_ric + "=R"
         self.timezone = timezone
 
 class FixedIncome(Security):
-    def __init__(self,base_ric,timezone):
+    def __init__(self,base_ric,timezone,venue=None):
         Security.__init__(self,base_ric)
+        self.venue = venue
 
         self.chain_rics = base_ric
         self.ric_type = "ChainRIC"
         self.timezone = timezone
 
 
+class Universe(Security):
+    def __init__(self,securities,name="Universe"):
+        Security.__init__(self,name)
+
+        timezones = set(security.timezone for security in securities)
+        if len(timezones) != 1:
+            raise Exception("securities in a universe must share one timezone")
+        elif len(securities) > MAX_IDENTIFIERS:
+            raise Exception("a universe holds at most %d securities" % (MAX_IDENTIFIERS))
+
+        self.securities = list(securities)
+        self.timezone = timezones.pop()
+
+    def calendar(self):
+        # members on different venues fall back on every calendar day
+        calendars = set(security.calendar() for security in self.securities)
+        return calendars.pop() if len(calendars) == 1 else Calendar()
+
+    def instrument_identifiers(self):
+        identifiers = []
+        for security in self.securities:
+            identifiers += security.instrument_identifiers()
+        return identifiers
+
+    def historical_chain_resolution(self,session,start_date,end_date=None):
+        # members which are not chains are requested as they are, since the
+        # API resolves them to nothing
+        identifier_list = []
+        for security in self.securities:
+            if security.is_chain():
+                identifiers = security.historical_chain_resolution(session,start_date,end_date)
+            else:
+                identifiers = security.instrument_identifiers()
+
+            for item in identifiers:
+                if item not in identifier_list:
+                    identifier_list.append(item)
+
+        return identifier_list
+
+    def owners(self,session,start_date,end_date=None):
+        # map every RIC the extraction can return to the security it belongs to
+        owners = {}
+        for security in self.securities:
+            if security.is_chain():
+                identifiers = security.historical_chain_resolution(session,start_date,end_date)
+            else:
+                identifiers = security.instrument_identifiers()
+
+            for item in identifiers:
+                owners.setdefault(item["Identifier"],security.base_ric)
+
+        return owners
+
+## CALENDARS ##################################################################
+
+class Calendar:
+    # without a venue every calendar day is requested in full
+    def __init__(self,weekmask="Mon Tue Wed Thu Fri Sat Sun",rules=(),
+            open_time="00:00:00.000000",close_time="23:59:59.999999"):
+        self.weekmask = weekmask
+        self.rules = list(rules)
+        self.open_time = open_time
+        self.close_time = close_time
+
+        # sessions which open the evening before their trade date
+        self.overnight = open_time > close_time
+
+    def trading_days(self,start_date,end_date):
+        holidays = []
+        for rule in self.rules:
+            holidays += rule.dates(start_date,end_date).to_list()
+
+        trading_days = pd.bdate_range(
+            start_date,
+            end_date,
+            freq = "C",
+            weekmask = self.weekmask,
+            holidays = holidays
+        )
+
+        return trading_days.strftime("%Y-%m-%d").to_list()
+
+    def active_days(self,start_date,end_date):
+        if not self.overnight:
+            return self.trading_days(start_date,end_date)
+
+        # a calendar day is active when its own session or the next one trades
+        next_date = (pd.Timestamp(end_date) + pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+        trading_days = set(self.trading_days(start_date,next_date))
+
+        active_days = []
+        for date in pd.date_range(start_date,end_date):
+            following = (date + pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+            date = date.strftime("%Y-%m-%d")
+            if date in trading_days or following in trading_days:
+                active_days.append(date)
+
+        return active_days
+
+    def session_window(self,date):
+        # local start and end of trading on a calendar date
+        if not self.overnight:
+            return (date + "T" + self.open_time,date + "T" + self.close_time)
+
+        following = (pd.Timestamp(date) + pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+        trading_days = self.trading_days(date,following)
+
+        start_time = "00:00:00.000000" if date in trading_days else self.open_time
+        end_time = "23:59:59.999999" if following in trading_days else self.close_time
+
+        # nothing trades on this day, but it was asked for explicitly
+        if start_time > end_time:
+            start_time,end_time = "00:00:00.000000","23:59:59.999999"
+
+        return (date + "T" + start_time,date + "T" + end_time)
+
+# full closures only, early closes still have data worth requesting
+CALENDARS = {
+    "CME": Calendar(
+        weekmask = "Mon Tue Wed Thu Fri",
+        rules = [
+            holiday.Holiday("New Years Day",month=1,day=1,observance=holiday.sunday_to_monday),
+            holiday.GoodFriday,
+            holiday.Holiday("Christmas",month=12,day=25,observance=holiday.nearest_workday)
+        ],
+        open_time = "17:00:00.000000",
+        close_time = "16:00:00.000000"
+    ),
+    "NYSE": Calendar(
+        weekmask = "Mon Tue Wed Thu Fri",
+        rules = [
+            holiday.Holiday("New Years Day",month=1,day=1,observance=holiday.sunday_to_monday),
+            holiday.USMartinLutherKingJr,
+            holiday.USPresidentsDay,
+            holiday.GoodFriday,
+            holiday.USMemorialDay,
+            holiday.Holiday("Juneteenth",month=6,day=19,start_date="2022-01-01",observance=holiday.nearest_workday),
+            holiday.Holiday("Independence Day",month=7,day=4,observance=holiday.nearest_workday),
+            holiday.USLaborDay,
+            holiday.USThanksgivingDay,
+            holiday.Holiday("Christmas",month=12,day=25,observance=holiday.nearest_workday)
+        ],
+        # including pre and post market trading
+        open_time = "04:00:00.000000",
+        close_time = "20:00:00.000000"
+    )
+}
+
+DEFAULT_VENUES = {
+    ("Futures","US/Central"): "CME",
+    ("Futures","America/Chicago"): "CME",
+    ("Equity","US/Eastern"): "NYSE",
+    ("Equity","America/New_York"): "NYSE"
+}
+
+def universes(securities,size=MAX_IDENTIFIERS,name="Universe"):
+    # pack securities into as few batches as possible, one timezone at a time
+    by_timezone = {}
+    for security in securities:
+        by_timezone.setdefault(security.timezone,[]).append(security)
+
+    batches = []
+    for members in by_timezone.values():
+        for i in range(0,len(members),size):
+            batch_name = "%s-%d" % (name,len(batches)+1)
+            batches.append(Universe(members[i:i+size],batch_name))
+
+    return batches
+
+
+## COMPRESSION ################################################################
+
+EXTENSIONS = {
+    "gzip": ".gz",
+    "zstd": ".zst",
+    "lz4": ".lz4",
+    "none": ""
+}
+
+def compression_extension(codec=None):
+    return EXTENSIONS[COMPRESSION if codec is None else codec]
+
+def compress_block(data,codec=None,level=None):
+    # every block is a complete frame of its own, and frames written one
+    # after the other read back as a single stream for all three codecs
+    codec = COMPRESSION if codec is None else codec
+    level = COMPRESSION_LEVEL if level is None else level
+
+    if codec == "gzip":
+        return gzip.compress(data,compresslevel=6 if level is None else level,mtime=0)
+    elif codec == "zstd":
+        import zstandard
+        return zstandard.ZstdCompressor(level=3 if level is None else level).compress(data)
+    elif codec == "lz4":
+        import lz4.frame
+        return lz4.frame.compress(data,compression_level=0 if level is None else level)
+    return data
+
+def open_compressed(filepath,mode="rb"):
+    # the codec is read off the extension, text modes decode as utf-8
+    if filepath.endswith(".gz"):
+        f = gzip.open(filepath,"rb")
+    elif filepath.endswith(".zst"):
+        import zstandard
+        f = zstandard.ZstdDecompressor().stream_reader(open(filepath,"rb"),read_across_frames=True,closefd=True)
+    elif filepath.endswith(".lz4"):
+        import lz4.frame
+        f = lz4.frame.open(filepath,"rb")
+    else:
+        f = open(filepath,"rb")
+
+    if "t" in mode:
+        return io.TextIOWrapper(f,encoding="utf-8",newline="")
+    return f
+
+class BlockWriter:
+    # lines are gathered into blocks, which the pool compresses while the
+    # caller carries on reading, and which are written back in order
+    def __init__(self,filepath,pool,codec=None,level=None,block_size=None,max_pending=4):
+        self.filepath = filepath
+        self.file = open(filepath,"wb")
+        self.pool = pool
+        self.codec = COMPRESSION if codec is None else codec
+        self.level = level
+        self.block_size = COMPRESSION_BLOCK if block_size is None else block_size
+        self.max_pending = max_pending
+
+        self.lines = []
+        self.size = 0
+        self.pending = collections.deque()
+
+    def write(self,line):
+        self.lines.append(line)
+        self.size += len(line)
+        if self.size >= self.block_size:
+            self.flush()
+
+    def flush(self):
+        if self.lines:
+            data = "".join(self.lines).encode("utf-8")
+            self.pending.append(self.pool.submit(compress_block,data,self.codec,self.level))
+            self.lines = []
+            self.size = 0
+
+        # write finished blocks, waiting on the oldest when too many are held
+        while self.pending and (self.pending[0].done() or len(self.pending) > self.max_pending):
+            self.resume()
+            self.file.write(self.pending.popleft().result())
+
+    def resume(self):
+        # blocks are whole frames, so a suspended file is simply appended to
+        if self.file is None:
+            self.file = open(self.filepath,"ab")
+
+    def suspend(self):
+        # write out everything held and give the file handle back
+        self.close()
+        self.file = None
+
+    def close(self):
+        if self.file is None and not self.lines:
+            return
+
+        try:
+            self.flush()
+            while self.pending:
+                self.resume()
+                self.file.write(self.pending.popleft().result())
+        finally:
+            if self.file is not None:
+                self.file.close()
+
+## SCHEMAS ####################################################################
+
+# column types of each report, so files load compactly and timestamps are
+# parsed once; prices stay float64 since float32 cannot hold every tick
+# increment exactly, but counts and sizes are narrowed
+TICK_COLUMNS = {
+    "#RIC": "category",
+    "Domain": "category",
+    "Date-Time": "datetime64[ns, UTC]",
+    "GMT Offset": "float32",
+    "Type": "category"
+}
+
+DEPTH_LEVELS = 10
+
+# bump whenever the schemas, or the days daily files cover, change, so older
+# files can be found in the catalog; since 2 every daily file covers a local day
+SCHEMA_VERSION = 2
+
+SCHEMAS = {
+    "Trades": {
+        **TICK_COLUMNS,
+        "Price": "float64",
+        "Volume": "Int64",
+        "Acc. Volume": "Int64",
+        "Seq. No.": "Int64"
+    },
+    "Quotes": {
+        **TICK_COLUMNS,
+        "Bid Price": "float64",
+        "Bid Size": "Int32",
+        "Ask Price": "float64",
+        "Ask Size": "Int32",
+        "Seq. No.": "Int64"
+    },
+    "Depths": {
+        **TICK_COLUMNS,
+        **{
+            "L%d-%s" % (level,column): dtype
+            for level in range(1,DEPTH_LEVELS+1)
+            for column,dtype in [
+                ("BidPrice","float64"),
+                ("BidSize","Int32"),
+                ("BuyNo","Int16"),
+                ("AskPrice","float64"),
+                ("AskSize","Int32"),
+                ("SellNo","Int16")
+            ]
+        }
+    },
+    "IntraDay": {
+        **TICK_COLUMNS,
+        "High Ask": "float64",
+        "High Ask Size": "Int32",
+        "High Bid": "float64",
+        "High Bid Size": "Int32",
+        "Low Ask": "float64",
+        "Low Ask Size": "Int32",
+        "Low Bid": "float64",
+        "Low Bid Size": "Int32",
+        "Volume": "Int64"
+    },
+    "EndOfDay": {
+        "Trade Date": "datetime64[ns]",
+        "RIC": "category",
+        "Expiration Date": "datetime64[ns]",
+        "Last Trading Day": "datetime64[ns]",
+        "Open": "float64",
+        "Settlement Price": "float64",
+        "Universal Close Price": "float64",
+        "Universal Ask Price": "float64",
+        "Universal Bid Price": "float64",
+        "Bid": "float64",
+        "Ask": "float64",
+        "Volume": "Int64",
+        "Floor Volume": "Int64",
+        "Open Interest": "Int64"
+    }
+}
+
+# trades matched with the quotes in force when they happened (see taq.py)
+SCHEMAS["TAQ"] = {
+    **SCHEMAS["Trades"],
+    "Quote Time": "datetime64[ns, UTC]",
+    "Bid Price": "float64",
+    "Bid Size": "Int32",
+    "Ask Price": "float64",
+    "Ask Size": "Int32",
+    "NBB": "float64",
+    "NBO": "float64",
+    "Mid": "float64",
+    "Sign": "Int8",
+    "Effective Spread": "float64"
+}
+
+# bars resampled from trades and quotes (see resample.py)
+SCHEMAS["Bars"] = {
+    "#RIC": "category",
+    "Bar": "datetime64[ns, UTC]",
+    **dict.fromkeys(["Open","High","Low","Close","VWAP","Turnover"],"float64"),
+    "Volume": "Int64",
+    "Trades": "Int64",
+    **dict.fromkeys(["Open Bid","High Bid","Low Bid","Close Bid"],"float64"),
+    **dict.fromkeys(["Open Ask","High Ask","Low Ask","Close Ask"],"float64"),
+    "Close Bid Size": "Int32",
+    "Close Ask Size": "Int32",
+    "Quotes": "Int64"
+}
+
+def read_extraction(filepath,report_type,usecols=None,**kwargs):
+    # columns outside the schema, e.g. extra fields, are left to pandas, and
+    # requested columns which the file does not have are skipped
+    schema = SCHEMAS.get(report_type,{})
+    with open_compressed(filepath) as f:
+        header = pd.read_csv(f,nrows=0).columns
+    columns = [column for column in header if usecols is None or column in usecols]
+    usecols = None if usecols is None else columns
+
+    # callers may override the schema, e.g. to read sizes straight as floats
+    dtypes = {
+        column: schema[column] for column in columns
+        if column in schema and not schema[column].startswith("datetime64")
+    }
+    dtypes.update(kwargs.pop("dtype",{}))
+    timestamps = [
+        column for column in columns
+        if column in schema and schema[column].startswith("datetime64")
+    ]
+
+    if kwargs.get("chunksize") is not None:
+        # a later chunk may hold fractional sizes, so integers are read as
+        # floats and only go back to integers in chunks of whole numbers
+        integers = {column: dtype for column,dtype in dtypes.items() if dtype.startswith("Int")}
+        dtypes.update(dict.fromkeys(integers,"float64"))
+        reader = pd.read_csv(csv_source(filepath),usecols=usecols,dtype=dtypes,**kwargs)
+        return (parse_timestamps(whole_integers(chunk,integers),schema,timestamps) for chunk in reader)
+
+    try:
+        frame = pd.read_csv(csv_source(filepath),usecols=usecols,dtype=dtypes,**kwargs)
+    except (TypeError,ValueError):
+        # fractional sizes, e.g. for currencies, do not fit integer columns
+        dtypes = {column: "float64" if dtype.startswith("Int") else dtype for column,dtype in dtypes.items()}
+        frame = pd.read_csv(csv_source(filepath),usecols=usecols,dtype=dtypes,**kwargs)
+
+    return parse_timestamps(frame,schema,timestamps)
+
+def whole_integers(frame,integers):
+    for column,dtype in integers.items():
+        values = frame[column]
+        if (values.dropna() % 1 == 0).all():
+            frame[column] = values.astype(dtype)
+    return frame
+
+def csv_source(filepath):
+    # pandas reads gzip and zstd files itself, but not lz4
+    if filepath.endswith(".lz4"):
+        return open_compressed(filepath)
+    return filepath
+
+def parse_timestamps(frame,schema,timestamps):
+    for column in timestamps:
+        parsed = pd.to_datetime(
+            frame[column],
+            utc = schema[column].endswith("UTC]"),
+            format = "ISO8601"
+        )
+        frame[column] = parsed.astype(schema[column])
+    return frame
+
 ## UTILITIES ##################################################################
 
+def read_token_cache():
+    try:
+        with open(TOKEN_CACHE) as f:
+            return json.load(f)
+    except (OSError,ValueError):
+        return {}
+
+def write_token_cache(tokens):
+    # write privately and atomically, so no reader sees a partial file
+    partial_path = TOKEN_CACHE + ".part"
+    fd = os.open(partial_path,os.O_WRONLY | os.O_CREAT | os.O_TRUNC,0o600)
+    with os.fdopen(fd,"w") as f:
+        json.dump(tokens,f)
+    os.replace(partial_path,TOKEN_CACHE)
+
+def data_path(*parts):
+    # a path under DATA_DIR as it is set now, not when a module was imported
+    return os.path.join(DATA_DIR,*parts)
+
+def relative_path(filepath):
+    return None if filepath is None else os.path.relpath(filepath,DATA_DIR)
+
+def resolve_file(row):
+    record = dict(row)
+    if record["file"] is not None:
+        record["file"] = data_path(record["file"])
+    return record
+
+@contextlib.contextmanager
+def chain_cache():
+    path = data_path(CHAIN_CACHE)
+    os.makedirs(os.path.dirname(path) or ".",exist_ok=True)
+    connection = sqlite3.connect(path,timeout=60)
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS chains ("
+        "chain_ric TEXT, utc_start TEXT, utc_end TEXT, constituents TEXT, "
+        "PRIMARY KEY (chain_ric,utc_start,utc_end))"
+    )
+
+    # commit on success, and always close the connection
+    try:
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
 # for reading status reports and requests
 def md5(filename):
     hash_md5 = hashlib.md5()
@@ -669,6 +2026,246 @@ def md5(filename):
             hash_md5.update(chunk)
     return hash_md5.hexdigest()
 
+# the date prefix of a row, as written in the date column of every report
+ISO_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+def local_day_bounds(date,timezone):
+    # the local date at the start of a utc date, the utc time during it at
+    # which the local date changes (None if it does not) and the date after
+    start = pd.Timestamp(date,tz="UTC")
+    before = start.tz_convert(timezone).strftime("%Y-%m-%d")
+    after = (start + pd.Timedelta(days=1) - pd.Timedelta(1)).tz_convert(timezone).strftime("%Y-%m-%d")
+    if before == after:
+        return (None,before,after)
+
+    midnight = pd.Timestamp(after).tz_localize(timezone,nonexistent="shift_forward").tz_convert("UTC")
+    return (midnight.strftime("%Y-%m-%dT%H:%M:%S.%f"),before,after)
+
+def split_by_date(filepath,date_col,filepaths,ric_col=None,owners=None,stats=None,filepath_for=None,
+        timezone=None,max_open=MAX_OPEN_FILES):
+    # the date prefix of each row picks its output, so the bulk file is never
+    # parsed into a frame and each row is touched exactly once; with owners,
+    # outputs are keyed by (owner of the row's RIC, date) instead; with stats,
+    # the first and last timestamp and rows of each RIC are kept per output;
+    # rows of dates nobody expected (e.g. a session on a calendar holiday) go
+    # to a new output from filepath_for rather than being thrown away, unless
+    # it has none for them; with a timezone, utc stamps are dated by their
+    # local day, which only takes comparing them with the utc local midnight
+    # outputs are only opened once they get a row, and at most max_open of
+    # them are written to at once; outputs without rows are never created
+    pool = concurrent.futures.ThreadPoolExecutor(COMPRESSION_THREADS)
+    writers = {}
+    active = collections.OrderedDict()
+    last_key = None
+    row_counts = {key: 0 for key,path in filepaths.items() if path is not None}
+    ric_stats = {key: {} for key in row_counts}
+    known_dates = {}
+    dropped = 0
+
+    try:
+        with gzip.open(filepath,"rt",encoding="utf-8",newline="") as f:
+            header = f.readline()
+
+            columns = next(csv.reader([header]))
+            date_index = columns.index(date_col)
+            ric_index = columns.index(ric_col) if ric_col in columns else date_index
+            last_index = max(date_index,ric_index)
+
+            for line in f:
+                if '"' in line:
+                    fields = next(csv.reader([line]))
+                else:
+                    fields = line.split(",",last_index+1)
+
+                # dates which are not already ISO formatted are parsed once
+                prefix = fields[date_index][0:10]
+                day = known_dates.get(prefix)
+                if day is None:
+                    try:
+                        date = pd.Timestamp(prefix).strftime("%Y-%m-%d")
+                    except ValueError:
+                        date = prefix
+
+                    if timezone is not None and date == prefix and ISO_DATE.fullmatch(date):
+                        day = local_day_bounds(date,timezone)
+                    else:
+                        day = (None,date,date)
+                    known_dates[prefix] = day
+
+                boundary,date,next_date = day
+                if boundary is not None and fields[date_index] >= boundary:
+                    date = next_date
+
+                key = date if owners is None else (owners.get(fields[ric_index]),date)
+                writer = writers.get(key)
+                if key not in writers:
+                    path = filepaths.get(key)
+                    if key not in filepaths and filepath_for is not None and ISO_DATE.fullmatch(date):
+                        path = filepath_for(key)
+
+                    if path is not None:
+                        writer = BlockWriter(path,pool)
+                        writer.write(header)
+                        row_counts.setdefault(key,0)
+                        ric_stats.setdefault(key,{})
+                    writers[key] = writer
+
+                if writer is None:
+                    dropped += 1
+                else:
+                    # rows mostly come in runs of one RIC, so the bookkeeping
+                    # only happens when the output changes
+                    if key != last_key:
+                        last_key = key
+                        if key in active:
+                            active.move_to_end(key)
+                        else:
+                            active[key] = writer
+                            if len(active) > max_open:
+                                active.popitem(last=False)[1].suspend()
+
+                    writer.write(line)
+                    row_counts[key] += 1
+
+                    if stats is not None:
+                        stamp = fields[date_index]
+                        stat = ric_stats[key].get(fields[ric_index])
+                        if stat is None:
+                            ric_stats[key][fields[ric_index]] = [stamp,stamp,1]
+                        else:
+                            if stamp < stat[0]:
+                                stat[0] = stamp
+                            elif stamp > stat[1]:
+                                stat[1] = stamp
+                            stat[2] += 1
+    finally:
+        for writer in writers.values():
+            if writer is not None:
+                writer.close()
+        pool.shutdown()
+
+    # rows which belong to no output at all are counted, never lost silently
+    if dropped:
+        print("Dropped %d rows of %s outside the requested days" % (dropped,os.path.basename(filepath)))
+        metrics.observe("dropped_rows",dropped)
+
+    if stats is not None:
+        stats.update(ric_stats)
+
+    return row_counts
+
+def file_stats(filepath,date_col,ric_col):
+    # the same statistics as split_by_date, for a file that was not split
+    ric_stats = {}
+    with open_compressed(filepath,"rt") as f:
+        reader = csv.reader(f)
+        columns = next(reader,[])
+        if date_col not in columns:
+            return ric_stats
+
+        date_index = columns.index(date_col)
+        ric_index = columns.index(ric_col) if ric_col in columns else date_index
+        last_index = max(date_index,ric_index)
+        for fields in reader:
+            if len(fields) <= last_index:
+                continue
+
+            stamp = fields[date_index]
+            stat = ric_stats.get(fields[ric_index])
+            if stat is None:
+                ric_stats[fields[ric_index]] = [stamp,stamp,1]
+            else:
+                stat[0] = min(stat[0],stamp)
+                stat[1] = max(stat[1],stamp)
+                stat[2] += 1
+
+    return ric_stats
+
+def catalog_time(timestamp):
+    # fixed width utc (or naive local) iso strings sort the same as the times
+    try:
+        timestamp = pd.Timestamp(timestamp)
+    except ValueError:
+        return str(timestamp)
+
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.tz_convert("UTC").tz_localize(None)
+    return timestamp.isoformat(timespec="nanoseconds")
+
+def write_parquet(csv_filepath,parquet_filepath,date_col,report_type=None):
+    # only needed for the parquet output format
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    daily_data = read_extraction(csv_filepath,report_type)
+    if not pd.api.types.is_datetime64_any_dtype(daily_data[date_col]):
+        daily_data[date_col] = pd.to_datetime(daily_data[date_col],utc=(date_col == "Date-Time"),format="ISO8601")
+
+    # sorted timestamps keep the row group min/max statistics tight
+    daily_data = daily_data.sort_values(date_col,kind="stable")
+    table = pa.Table.from_pandas(daily_data,preserve_index=False)
+
+    partial_filepath = parquet_filepath + ".part"
+    pq.write_table(
+        table,
+        partial_filepath,
+        row_group_size = PARQUET_ROW_GROUP,
+        write_statistics = True,
+        compression = "zstd"
+    )
+    os.replace(partial_filepath,parquet_filepath)
+
+def write_frame(frame,filepath):
+    # data derived from daily files is kept the same way, as parquet or as
+    # csv compressed with the configured codec
+    partial_filepath = filepath + ".part"
+    if filepath.endswith(".parquet"):
+        frame.to_parquet(partial_filepath,index=False,row_group_size=PARQUET_ROW_GROUP,compression="zstd")
+    else:
+        # utc timestamps are written the way reports write them, which is far
+        # faster than having pandas format them
+        frame = frame.assign(**{
+            column: iso_timestamps(frame[column]) for column in frame.columns
+            if isinstance(frame[column].dtype,pd.DatetimeTZDtype)
+        })
+        with open(partial_filepath,"wb") as f:
+            f.write(compress_block(frame.to_csv(index=False).encode("utf-8")))
+    os.replace(partial_filepath,filepath)
+
+def iso_timestamps(series):
+    values = series.dt.tz_convert("UTC").array.as_unit("ns").tz_localize(None).to_numpy()
+    strings = np.char.add(np.datetime_as_string(values,unit="ns"),"Z")
+    return np.where(np.isnat(values),"",strings)
+
+def extraction_seconds(json_response):
+    # the notes of a finished job say how long the server spent extracting
+    try:
+        notes = json_response.json().get("Notes",[])
+    except ValueError:
+        return None
+
+    for note in notes:
+        match = re.search(r"taking ([0-9.]+) Sec",note)
+        if match is not None:
+            return float(match.group(1))
+
+    return None
+
+def daily_filename(date):
+    if OUTPUT_FORMAT == "parquet":
+        return "%s.parquet" % (date)
+    return csv_filename(date)
+
+def csv_filename(date):
+    return "%s.csv%s" % (date,compression_extension())
+
+def count_lines(filepath):
+    lines = 0
+    with open_compressed(filepath) as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE),b""):
+            lines += chunk.count(b"\n")
+    return lines
+
 def convert_to_utc(str_date,timezone):
     date_time  = pd.to_datetime(str_date)
     local_time = date_time.tz_localize(timezone)
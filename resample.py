@@ -0,0 +1,226 @@
+from refinitiv_rest import *
+from reader import daily_files,iter_partition,read_partition
+from concurrent.futures import ProcessPoolExecutor
+
+## SETTINGS ###################################################################
+
+# bars of each interval are cached by day, next to the ticks they came from
+BARS_REPORT = "Bars"
+
+# days are resampled in parallel, one process per core by default, reading
+# this many ticks at a time
+RESAMPLE_PROCS = os.cpu_count()
+RESAMPLE_CHUNK_ROWS = 1000000
+
+# each bar column is (tick column, aggregation); partial bars from separate
+# chunks are then combined with the matching aggregation
+TRADE_BARS = {
+    "Open": ("Price","first"),
+    "High": ("Price","max"),
+    "Low": ("Price","min"),
+    "Close": ("Price","last"),
+    "Volume": ("Volume","sum"),
+    "Turnover": ("Turnover","sum"),
+    "Trades": ("Date-Time","count")
+}
+
+QUOTE_BARS = {
+    "Open Bid": ("Bid Price","first"),
+    "High Bid": ("Bid Price","max"),
+    "Low Bid": ("Bid Price","min"),
+    "Close Bid": ("Bid Price","last"),
+    "Open Ask": ("Ask Price","first"),
+    "High Ask": ("Ask Price","max"),
+    "Low Ask": ("Ask Price","min"),
+    "Close Ask": ("Ask Price","last"),
+    "Close Bid Size": ("Bid Size","last"),
+    "Close Ask Size": ("Ask Size","last"),
+    "Quotes": ("Date-Time","count")
+}
+
+COMBINE = {
+    "first": "first",
+    "last": "last",
+    "max": "max",
+    "min": "min",
+    "sum": "sum",
+    "count": "sum"
+}
+
+# read straight as floats, nullable integers parse far slower
+FLOAT_COLUMNS = ["Volume","Bid Size","Ask Size"]
+
+## BARS #######################################################################
+
+def interval_name(interval):
+    # one spelling per interval, e.g. "300s" and "5min" share a cache
+    return pd.tseries.frequencies.to_offset(pd.Timedelta(interval)).freqstr
+
+def partial_bars(chunk,interval,spec):
+    # the bars of one chunk; bars which run across chunks are only partial
+    columns = {Extraction.ric_col: chunk[Extraction.ric_col],"Bar": chunk[Extraction.date_col].dt.floor(interval)}
+    for column,_ in spec.values():
+        columns[column] = chunk[column]
+
+    frame = pd.DataFrame(columns)
+    grouped = frame.groupby([Extraction.ric_col,"Bar"],sort=False,observed=True)
+    return grouped.agg(**{name: (column,how) for name,(column,how) in spec.items()})
+
+def stream_bars(filepath,report_type,interval,spec,chunksize=RESAMPLE_CHUNK_ROWS):
+    # ticks are read a chunk at a time and only their bars are kept, so the
+    # memory used is that of one chunk plus the bars of the day
+    columns = list(dict.fromkeys([Extraction.ric_col,Extraction.date_col,*[column for column,_ in spec.values()]]))
+    dtype = dict.fromkeys(FLOAT_COLUMNS,"float64")
+
+    parts = []
+    for chunk in iter_partition(filepath,report_type,columns,dtype,chunksize):
+        if "Turnover" in columns and "Volume" in chunk.columns:
+            chunk["Turnover"] = chunk["Price"] * chunk["Volume"]
+        parts.append(partial_bars(chunk,interval,{
+            name: (column,how) for name,(column,how) in spec.items() if column in chunk.columns
+        }))
+
+    if not parts:
+        return None
+
+    # chunks follow the file order, so the first and last of each bar hold
+    frame = pd.concat(parts)
+    grouped = frame.groupby(level=[0,1],sort=False,observed=True)
+    return grouped.agg({name: COMBINE[spec[name][1]] for name in frame.columns})
+
+def resample_day(trades_filepath,quotes_filepath,interval,output_filepath,chunksize=RESAMPLE_CHUNK_ROWS):
+    # the trade and quote bars of one day, side by side, in one process
+    bars = []
+    if trades_filepath is not None:
+        trade_bars = stream_bars(trades_filepath,"Trades",interval,TRADE_BARS,chunksize)
+        if trade_bars is not None:
+            trade_bars["VWAP"] = trade_bars["Turnover"] / trade_bars["Volume"]
+            bars.append(trade_bars)
+
+    if quotes_filepath is not None:
+        quote_bars = stream_bars(quotes_filepath,"Quotes",interval,QUOTE_BARS,chunksize)
+        if quote_bars is not None:
+            bars.append(quote_bars)
+
+    if bars:
+        frame = pd.concat(bars,axis=1).sort_index().reset_index()
+    else:
+        frame = pd.DataFrame(columns=[Extraction.ric_col,"Bar"])
+
+    # counts go back to the integer types of the schema before writing,
+    # unless they are fractional, e.g. the volume of currencies
+    schema = SCHEMAS[BARS_REPORT]
+    frame = whole_integers(frame,{
+        column: schema[column] for column in frame.columns
+        if schema.get(column,"").startswith("Int")
+    })
+    write_frame(frame,output_filepath)
+    return len(frame)
+
+def combine_bars(frame):
+    # bars split over the files of neighbouring days become one bar each,
+    # combined like the bars of separate chunks; files must be in time order
+    grouped = frame.groupby([Extraction.ric_col,"Bar"],sort=False,observed=True)
+    spec = {**TRADE_BARS,**QUOTE_BARS}
+
+    columns = {}
+    for name in frame.columns:
+        if name not in spec:
+            continue
+        how = COMBINE[spec[name][1]]
+        columns[name] = grouped[name].sum(min_count=1) if how == "sum" else grouped[name].agg(how)
+
+    combined = pd.DataFrame(columns)
+    if "VWAP" in frame.columns:
+        combined["VWAP"] = combined["Turnover"] / combined["Volume"]
+    return combined.reset_index()[frame.columns]
+
+## CACHE ######################################################################
+
+def bars_filepath(security,interval,date):
+    output_dir = data_path(security.base_ric,BARS_REPORT,interval_name(interval))
+    os.makedirs(output_dir,exist_ok=True)
+    return os.path.join(output_dir,daily_filename(date))
+
+def is_cached(output_filepath,sources):
+    # bars are stale once the ticks they came from have been written again
+    if not os.path.exists(output_filepath):
+        return False
+
+    modified = os.path.getmtime(output_filepath)
+    return all(os.path.getmtime(source) <= modified for source in sources if source is not None)
+
+def resample_days(security,interval,start_date,end_date=None,num_procs=RESAMPLE_PROCS,overwrite=False):
+    # every held day missing from the cache is resampled in parallel, and
+    # the cached file of each day is returned
+    end_date = start_date if end_date is None else end_date
+    if isinstance(security,Universe):
+        securities = [*security.securities,security]
+    else:
+        securities = [security]
+
+    filepaths = []
+    jobs = []
+    for member in securities:
+        dates = member.calendar().active_days(start_date,end_date)
+        trades = daily_files(member,"Trades",dates)
+        quotes = daily_files(member,"Quotes",dates)
+
+        for date in dates:
+            if date not in trades and date not in quotes:
+                continue
+
+            output_filepath = bars_filepath(member,interval,date)
+            sources = (trades.get(date),quotes.get(date))
+            if overwrite or not is_cached(output_filepath,sources):
+                jobs.append((*sources,interval,output_filepath))
+            filepaths.append(output_filepath)
+
+    if jobs:
+        with ProcessPoolExecutor(min(num_procs,len(jobs))) as pool:
+            for future in [pool.submit(resample_day,*job) for job in jobs]:
+                future.result()
+
+    return filepaths
+
+def bars(security,interval,start_date,end_date=None,rics=None,num_procs=RESAMPLE_PROCS,overwrite=False):
+    # bars of a security over whole days, resampled only where not cached;
+    # each day only holds the part of a bar found in its own ticks, so the
+    # days either side are read too, for the rest of the bars at the edges
+    end_date = start_date if end_date is None else end_date
+    day = pd.Timedelta(days=1)
+    first = (pd.Timestamp(start_date) - day).strftime("%Y-%m-%d")
+    last = (pd.Timestamp(end_date) + day).strftime("%Y-%m-%d")
+
+    parts = []
+    for filepath in resample_days(security,interval,first,last,num_procs,overwrite):
+        frame = read_partition(filepath,BARS_REPORT)
+        if rics is not None:
+            frame = frame[frame[Extraction.ric_col].isin(rics)]
+        parts.append((os.path.basename(filepath)[0:10],frame))
+
+    inside = [frame for date,frame in parts if start_date <= date <= end_date]
+    if not inside:
+        return pd.DataFrame(columns=[Extraction.ric_col,"Bar"])
+
+    # only bars which also appear within the days asked for are kept, and
+    # days are put in time order so the first and last of each bar hold
+    keys = pd.concat(inside).set_index([Extraction.ric_col,"Bar"]).index
+    frames = []
+    for date,frame in sorted(parts,key=lambda part: part[0]):
+        if not start_date <= date <= end_date:
+            frame = frame[frame.set_index([Extraction.ric_col,"Bar"]).index.isin(keys)]
+        frames.append(frame)
+
+    frame = pd.concat(frames,ignore_index=True)
+    if frame.duplicated([Extraction.ric_col,"Bar"]).any():
+        frame = combine_bars(frame)
+    frame[Extraction.ric_col] = frame[Extraction.ric_col].astype("category")
+    return frame
+
+## MAIN #######################################################################
+
+if __name__ == "__main__":
+    ## five minute bars of the front contract over a month
+    five_minutes = bars(Futures("ES","US/Central"),"5min","2024-01-02","2024-01-31",rics=["ESH4"])
+    print(five_minutes)
@@ -0,0 +1,246 @@
+from refinitiv_rest import *
+from reader import daily_files,read_partition
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+## SETTINGS ###################################################################
+
+# joined days are kept next to the trades and quotes they came from
+TAQ_REPORT = "TAQ"
+
+# days are joined in parallel, one process per core by default
+TAQ_PROCS = os.cpu_count()
+
+# quotes must be this much older than a trade to be in force (in nanoseconds)
+QUOTE_LAG = 0
+
+# the quotes still in force at the open come from the last active day within
+# this many calendar days before it
+QUOTE_LOOKBACK_DAYS = 14
+
+TRADE_COLUMNS = ["#RIC","Date-Time","Price","Volume","Seq. No.","Exch Time"]
+QUOTE_COLUMNS = ["#RIC","Date-Time","Bid Price","Bid Size","Ask Price","Ask Size","Seq. No.","Exch Time"]
+
+# read straight as floats, nullable integers parse far slower
+FLOAT_COLUMNS = ["Volume","Seq. No.","Bid Size","Ask Size"]
+
+## KEYS #######################################################################
+
+def exchange_times(frame):
+    # nanoseconds since the epoch at the exchange, where the report has them;
+    # exchange times carry no date, so they take the one of Date-Time that
+    # lands within half a day of it
+    times = frame[Extraction.date_col].array.as_unit("ns").asi8
+    if "Exch Time" not in frame.columns:
+        return times
+
+    day = 24 * 3600 * 10**9
+    clock = pd.to_timedelta(frame["Exch Time"],errors="coerce").array.as_unit("ns")
+    clock = clock.to_numpy(dtype="int64",na_value=-1)
+
+    exchange = times - times % day + clock
+    exchange[exchange - times > day // 2] -= day
+    exchange[times - exchange > day // 2] += day
+    return np.where(clock < 0,times,exchange)
+
+def sequence_numbers(frame):
+    # missing sequence numbers sort before any other at the same time
+    if "Seq. No." not in frame.columns:
+        return np.full(len(frame),-1,dtype="int64")
+    return np.nan_to_num(frame["Seq. No."].to_numpy(dtype="float64",na_value=np.nan),nan=-1).astype("int64")
+
+def asof_positions(quote_times,quote_seqs,trade_times,trade_seqs):
+    # the last quote at or before each trade by time, then sequence number,
+    # with quotes ahead of trades on a full tie; quotes must already be in
+    # that order, and -1 means no quote yet
+    n = len(quote_times)
+    times = np.concatenate([quote_times,trade_times])
+    seqs = np.concatenate([quote_seqs,trade_seqs])
+    kinds = np.concatenate([np.zeros(n,dtype="int8"),np.ones(len(trade_times),dtype="int8")])
+    order = np.lexsort((kinds,seqs,times))
+
+    latest = np.maximum.accumulate(np.where(order < n,order,-1))
+    trades = order >= n
+
+    positions = np.empty(len(trade_times),dtype="int64")
+    positions[order[trades] - n] = latest[trades]
+    return positions
+
+def take(values,positions):
+    # values at the positions, with nan where there is none
+    taken = values[np.maximum(positions,0)] if len(values) else np.full(len(positions),np.nan)
+    return np.where(positions < 0,np.nan,taken)
+
+## JOIN #######################################################################
+
+def split_rics(frame):
+    # rows of each RIC, in exchange time and then sequence order
+    times = exchange_times(frame)
+    seqs = sequence_numbers(frame)
+    codes,rics = pd.factorize(frame[Extraction.ric_col])
+    order = np.lexsort((seqs,times,codes))
+    bounds = np.searchsorted(codes[order],np.arange(len(rics)+1))
+
+    groups = {}
+    for code,ric in enumerate(rics):
+        rows = order[bounds[code]:bounds[code+1]]
+        groups[ric] = (rows,times[rows],seqs[rows])
+    return groups
+
+def last_quotes(quotes):
+    # the last quote of each RIC, in exchange time and then sequence order
+    rows = [rows[-1] for rows,_,_ in split_rics(quotes).values() if len(rows)]
+    return quotes.iloc[rows]
+
+def tick_signs(prices):
+    # +1 after an uptick, -1 after a downtick, and the last of those when
+    # the price is unchanged
+    changes = np.sign(np.diff(prices,prepend=np.nan))
+    changes[changes == 0] = np.nan
+    return pd.Series(changes).ffill().fillna(0).to_numpy()
+
+def join_trades(trades,quotes,venues=None,lag=QUOTE_LAG):
+    # every trade with the quote of its own RIC in force, and the best bid
+    # and offer over the RICs of its venue group (by default just itself)
+    venues = {} if venues is None else venues
+    trade_groups = split_rics(trades)
+    quote_groups = split_rics(quotes)
+
+    members = {}
+    for ric in [*trade_groups,*quote_groups]:
+        members.setdefault(venues.get(ric,ric),set()).add(ric)
+
+    missing = np.full(len(quotes),np.nan)
+    bids = quotes["Bid Price"].to_numpy(dtype="float64",na_value=np.nan) if "Bid Price" in quotes.columns else missing
+    asks = quotes["Ask Price"].to_numpy(dtype="float64",na_value=np.nan) if "Ask Price" in quotes.columns else missing
+
+    quote_index = np.full(len(trades),-1,dtype="int64")
+    best_bid = np.full(len(trades),np.nan)
+    best_ask = np.full(len(trades),np.nan)
+
+    order = []
+    for ric,(rows,times,seqs) in trade_groups.items():
+        order.append(rows)
+        times = times - lag
+
+        for venue in sorted(members[venues.get(ric,ric)]):
+            if venue not in quote_groups:
+                continue
+
+            # sequence numbers only order quotes of the same RIC, so quotes of
+            # other venues are in force from their time on
+            quote_rows,quote_times,quote_seqs = quote_groups[venue]
+            trade_seqs = seqs if venue == ric else np.full(len(rows),np.iinfo("int64").max)
+            positions = asof_positions(quote_times,quote_seqs,times,trade_seqs)
+            matched = np.where(positions < 0,-1,quote_rows[np.maximum(positions,0)])
+
+            best_bid[rows] = np.fmax(best_bid[rows],take(bids,matched))
+            best_ask[rows] = np.fmin(best_ask[rows],take(asks,matched))
+            if venue == ric:
+                quote_index[rows] = matched
+
+    # trades are returned per RIC in exchange order
+    bounds = np.cumsum([0,*[len(rows) for rows in order]])
+    order = np.concatenate(order) if order else np.array([],dtype="int64")
+    joined = trades.iloc[order].reset_index(drop=True)
+    quote_index = quote_index[order]
+
+    in_force = quote_index >= 0
+    for name in ["Date-Time","Bid Price","Bid Size","Ask Price","Ask Size"]:
+        column = "Quote Time" if name == "Date-Time" else name
+        if name in quotes.columns and len(quotes):
+            values = quotes[name].iloc[np.maximum(quote_index,0)].reset_index(drop=True)
+            joined[column] = values.where(in_force)
+        else:
+            joined[column] = np.nan
+
+    joined["NBB"] = best_bid[order]
+    joined["NBO"] = best_ask[order]
+
+    # lee and ready: trades above the mid were bought, below it sold, and at
+    # the mid (or without quotes) are signed by the tick test
+    prices = joined["Price"].to_numpy(dtype="float64",na_value=np.nan)
+    mid = (joined["NBB"].to_numpy() + joined["NBO"].to_numpy()) / 2
+    ticks = np.zeros(len(joined))
+    for start,end in zip(bounds[:-1],bounds[1:]):
+        ticks[start:end] = tick_signs(prices[start:end])
+
+    with np.errstate(invalid="ignore"):
+        sign = np.where(prices > mid,1,np.where(prices < mid,-1,ticks))
+
+    joined["Mid"] = mid
+    joined["Sign"] = pd.array(sign.astype("int8"),dtype="Int8")
+    joined["Effective Spread"] = 2 * sign * (prices - mid)
+    return joined
+
+## DAYS #######################################################################
+
+def join_day(trades_filepath,quotes_filepath,output_filepath,venues=None,lag=QUOTE_LAG,previous_filepath=None):
+    # one day in one process, only the columns the join needs are read
+    dtype = dict.fromkeys(FLOAT_COLUMNS,"float64")
+    trades = read_partition(trades_filepath,"Trades",TRADE_COLUMNS,dtype)
+    quotes = read_partition(quotes_filepath,"Quotes",QUOTE_COLUMNS,dtype)
+
+    # the first trades of the day meet the quotes left standing the day before
+    if previous_filepath is not None:
+        previous = read_partition(previous_filepath,"Quotes",QUOTE_COLUMNS,dtype)
+        quotes = pd.concat([last_quotes(previous),quotes],ignore_index=True)
+
+    # counts go back to the integer types of the schema before writing,
+    # unless they are fractional, e.g. the sizes of currencies
+    joined = join_trades(trades,quotes,venues,lag)
+    schema = SCHEMAS[TAQ_REPORT]
+    joined = whole_integers(joined,{column: schema[column] for column in FLOAT_COLUMNS if column in joined.columns})
+    write_frame(joined,output_filepath)
+    return len(joined)
+
+def taq_filepath(security,date):
+    output_dir = data_path(security.base_ric,TAQ_REPORT)
+    os.makedirs(output_dir,exist_ok=True)
+    return os.path.join(output_dir,daily_filename(date))
+
+def join_days(security,start_date,end_date=None,num_procs=TAQ_PROCS,venues=None,lag=QUOTE_LAG,overwrite=False):
+    # days with both trades and quotes held are joined in parallel; a
+    # universe joins the days of each of its members
+    end_date = start_date if end_date is None else end_date
+    if isinstance(security,Universe):
+        securities = [*security.securities,security]
+    else:
+        securities = [security]
+
+    lookback = pd.Timestamp(start_date) - pd.Timedelta(days=QUOTE_LOOKBACK_DAYS)
+    day_before = pd.Timestamp(start_date) - pd.Timedelta(days=1)
+
+    jobs = []
+    for member in securities:
+        calendar = member.calendar()
+        dates = calendar.active_days(start_date,end_date)
+        earlier = calendar.active_days(lookback.strftime("%Y-%m-%d"),day_before.strftime("%Y-%m-%d"))
+        days = [*earlier[-1:],*dates]
+        trades = daily_files(member,"Trades",dates)
+        quotes = daily_files(member,"Quotes",days)
+
+        for previous,date in zip([None,*days],days):
+            if date not in trades or date not in quotes:
+                continue
+
+            output_filepath = taq_filepath(member,date)
+            if overwrite or not os.path.exists(output_filepath):
+                jobs.append((member.base_ric,date,trades[date],quotes[date],output_filepath,quotes.get(previous)))
+
+    rows = {}
+    with ProcessPoolExecutor(max(min(num_procs,len(jobs)),1)) as pool:
+        futures = {
+            (base_ric,date): pool.submit(join_day,*filepaths,venues,lag,previous_filepath)
+            for base_ric,date,*filepaths,previous_filepath in jobs
+        }
+        for key,future in futures.items():
+            rows[key] = future.result()
+
+    return rows
+
+## MAIN #######################################################################
+
+if __name__ == "__main__":
+    ## join a month of ES trades and quotes
+    join_days(Futures("ES","US/Central"),"2024-01-02","2024-01-31")
@@ -1,111 +1,204 @@
-from multiprocessing import Process,Pipe
+from multiprocessing import Process
+from multiprocessing import Queue as ProcessQueue
+from threading import Thread,current_thread,main_thread
+from queue import Queue,Empty
 from time import sleep,time
 from sys import stdout
 from signal import signal,SIGPIPE,SIG_DFL
 
 ## TRACKER BASE CLASS #########################################################
 
+# redraws per second, and how long a finished stage stays on screen
+REFRESH_RATE = 4
+CLEAR_DELAY = 3
+
 class TrackerBase:
     # this is incredibly cursed, but it works...unlike tqdm
     ansi_fmt = "\x1b[%dB\x1b[2K%s\r\x1b[%dA"
-    
-    def __init__(self,position,description):
+
+    def __init__(self,position,description,timer=None):
         self.position = position
         self.description = description
-        self.timer = time()
+        self.timer = time() if timer is None else timer
+        self.stopped = None
 
     def formatter(self,message,elapsed_time=None):
         if message is None:
             message = self.description
-        
+
         if elapsed_time is not None:
             message = "%20s %7.2f" % (message,elapsed_time)
 
         return self.ansi_fmt % (self.position,message,self.position)
 
-    def display(self,message=None,show_time=True):
+    def render(self,message=None,show_time=True,now=None):
         if show_time:
-            elapsed_time = time() - self.timer
-            progress = self.formatter(message,elapsed_time)
+            elapsed_time = (time() if now is None else now) - self.timer
+            return self.formatter(message,elapsed_time)
         else:
-            progress = self.formatter(message)
-        
-        stdout.write(progress)
-        stdout.flush()
+            return self.formatter(message)
 
-        # prevents flickering in the console
-        sleep(0.01)
-    
-    def update(self):
-        # this is just an alias
-        self.display(None,True)
-    
-    def close(self,message):
-        self.display(message)
-        sleep(3)
-
-        # clear once done
-        self.display("",show_time=False)
-
-    def reset(self,description=None):
+    def reset(self,description=None,timer=None):
         if description is not None:
             self.description = description
 
-        self.timer = time()
+        self.timer = time() if timer is None else timer
+        self.stopped = None
 
-## ASYNC TRACKING FUNCTIONS ###################################################
+    def stop(self,description,timer=None):
+        self.description = description
+        self.stopped = time() if timer is None else timer
+
+## RENDERER ###################################################################
+
+class Renderer:
+    # one renderer per run draws every tracker from the events it receives,
+    # or logs one line per event when the output is not a terminal
+    def __init__(self,events,interactive=None):
+        self.events = events
+        self.interactive = stdout.isatty() if interactive is None else interactive
+
+        # trackers by position, with the time a finished one should be cleared
+        self.trackers = {}
+        self.finished = {}
+        self.started = {}
+
+    def handle(self,event):
+        kind,position,description,message,timestamp = event
+        if not self.interactive:
+            self.log(kind,position,description,message,timestamp)
+            return
+
+        tracker = self.trackers.get(position)
+        if kind == "begin":
+            if tracker is None:
+                tracker = TrackerBase(position,description,timestamp)
+                self.trackers[position] = tracker
+
+            tracker.reset("%s %s" % (message,description),timestamp)
+            self.finished.pop(position,None)
+        elif tracker is not None:
+            # freeze the elapsed time and keep the final message up for a bit
+            tracker.stop("%s %s" % (message,description),timestamp)
+            self.finished[position] = timestamp + CLEAR_DELAY
+
+    def log(self,kind,position,description,message,timestamp):
+        if kind == "begin":
+            self.started[position] = timestamp
+            elapsed_time = 0.0
+        else:
+            elapsed_time = timestamp - self.started.get(position,timestamp)
 
-def track_progress(pos,task_desc,pipe):
-    # recieve a starting message
-    open_msg = "%s %s" % (pipe.recv(),task_desc)
+        stdout.write(
+            "time=%.3f worker=%d task=\"%s\" stage=\"%s\" elapsed=%.2f\n" % (
+                timestamp,position,description,message,elapsed_time
+            )
+        )
+        stdout.flush()
 
-    # define tracker and show elapsed time
-    tracker = TrackerBase(pos,open_msg)
-    while (not pipe.poll()):
-        tracker.update()
+    def draw(self):
+        now = time()
+        frame = []
+        for position,tracker in sorted(self.trackers.items()):
+            if position in self.finished and now >= self.finished[position]:
+                # clear once done
+                frame.append(tracker.render("",show_time=False))
+                del self.finished[position]
+                del self.trackers[position]
+            else:
+                frame.append(tracker.render(now=tracker.stopped))
+
+        if frame:
+            stdout.write("".join(frame))
+            stdout.flush()
+
+    def run(self):
+        ignore_broken_pipes()
+
+        running = True
+        while running or self.finished:
+            deadline = time() + 1 / REFRESH_RATE
+
+            # take in events until the next redraw is due
+            while running:
+                try:
+                    event = self.events.get(timeout=max(deadline - time(),0))
+                except Empty:
+                    break
+
+                if event is None:
+                    running = False
+                else:
+                    self.handle(event)
+
+            # finished trackers still need clearing after the last event
+            if not running:
+                sleep(max(deadline - time(),0))
+
+            if self.interactive:
+                self.draw()
+
+def ignore_broken_pipes():
+    # to prevent broken pipe errors, which only the main thread may arrange
+    if current_thread() is main_thread():
+        signal(SIGPIPE,SIG_DFL)
 
-    # close it out and clear the terminal
-    close_msg = "%s %s" % (pipe.recv(),task_desc)
-    tracker.close(close_msg)
+def start_renderer(processes=False,interactive=None):
+    ignore_broken_pipes()
 
-def async_tracking(pos,task_desc):
-    pipe_in,pipe_out = Pipe()
-    tracker = Process(
-        target = track_progress,
-        args = (pos,task_desc,pipe_out)
-    )
+    # a thread serves trackers in this process, a process serves workers
+    events = ProcessQueue() if processes else Queue()
+    target = Renderer(events,interactive).run
 
-    return tracker,pipe_in
+    if processes:
+        renderer = Process(target=target,name="Renderer",daemon=True)
+    else:
+        renderer = Thread(target=target,name="Renderer",daemon=True)
+
+    renderer.start()
+    return events,renderer
+
+def stop_renderer(events,renderer):
+    events.put(None)
+    renderer.join()
+
+default_events = None
+
+def get_default_events():
+    # trackers without a renderer of their own share one thread per process
+    global default_events
+    if default_events is None:
+        default_events,_ = start_renderer()
+    return default_events
 
 class Tracker():
-    def __init__(self,position,task_description):
+    def __init__(self,position,task_description,events=None):
         self.position = position
         self.task_description = task_description
+        self.events = events
+        self.tracking = False
 
-        # to prevent broken pipe errors
-        signal(SIGPIPE,SIG_DFL)
+    def send(self,kind,message):
+        events = get_default_events() if self.events is None else self.events
+        events.put((kind,self.position,self.task_description,message,time()))
 
     def begin_tracking(self,message=""):
-        # store these both under one roof to minimize confusion
-        self.tracker,self.pipe = async_tracking(
-            self.position,
-            self.task_description
-        )
-
-        self.pipe.send(message)
-        self.tracker.start()
+        self.tracking = True
+        self.send("begin",message)
 
     def end_tracking(self,message):
-        try:
-            self.pipe.send(message)
-            self.tracker.join()
-        except:
-            raise "Tracking has yet to begin!"
+        if not self.tracking:
+            raise Exception("Tracking has yet to begin!")
+
+        self.tracking = False
+        self.send("end",message)
 
 ## MAIN #######################################################################
 
 if __name__ == "__main__":
-    tracker = Tracker(1,"test process")
+    events,renderer = start_renderer()
+    tracker = Tracker(1,"test process",events)
     tracker.begin_tracking("Processing")
     sleep(3)
-    tracker.end_tracking("Processed")
\ No newline at end of file
+    tracker.end_tracking("Processed")
+    stop_renderer(events,renderer)